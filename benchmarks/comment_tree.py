@@ -0,0 +1,136 @@
+"""
+Сравнение сборки дерева комментариев: старый рекурсивный build_comment_tree по ORM-связям
+против build_comment_forest по плоской выборке.
+
+Запуск из корня проекта:
+    python -m benchmarks.comment_tree
+    python -m benchmarks.comment_tree --sizes 1000 10000 --repeat 5
+"""
+import argparse
+import random
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+from utils.comments import build_comment_forest
+
+
+FlatRow = namedtuple("FlatRow", "id text author author_id created_at like_count parent_id")
+
+
+def legacy_build_comment_tree(comment, current_user_id: Optional[int] = None) -> Dict[str, Any]:
+    """Копия прежнего build_comment_tree (рекурсия + сортировка ответов + any() по лайкнувшим)"""
+    return {
+        "id": comment.id,
+        "text": comment.text,
+        "author": comment.author.nickname,
+        "author_id": comment.author.id,
+        "created_at": comment.created_at,
+        "like_count": comment.like_count,
+        "liked_by_user": current_user_id is not None
+                         and any(u.id == current_user_id for u in comment.liked_by),
+        "replies": [
+            legacy_build_comment_tree(reply, current_user_id)
+            for reply in sorted(
+                comment.replies,
+                key=lambda x: x.created_at,
+                reverse=True
+            )
+        ]
+    }
+
+
+def generate_thread(size: int, shape: str, users: int = 500, seed: int = 42):
+    """
+    Синтетическое обсуждение: shape=random - ответ на случайный предыдущий комментарий
+    (30% корневых), shape=chain - одна цепочка ответов глубиной size
+    """
+    rnd = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    authors = [SimpleNamespace(id=i, nickname=f"user{i}") for i in range(users)]
+
+    comments = []
+    for i in range(size):
+        if shape == "chain":
+            parent = comments[-1] if comments else None
+        else:
+            parent = rnd.choice(comments) if comments and rnd.random() > 0.3 else None
+
+        likers = rnd.sample(authors, rnd.randint(0, 20))
+        comments.append(SimpleNamespace(
+            id=i + 1,
+            text=f"comment {i + 1}",
+            author=rnd.choice(authors),
+            created_at=start + timedelta(seconds=i),
+            like_count=len(likers),
+            liked_by=likers,
+            parent=parent,
+            replies=[]
+        ))
+        if parent is not None:
+            parent.replies.append(comments[-1])
+
+    return comments
+
+
+def run_legacy(comments, user_id: int):
+    roots = sorted([c for c in comments if c.parent is None], key=lambda x: x.created_at, reverse=True)
+    return [legacy_build_comment_tree(comment, user_id) for comment in roots]
+
+
+def run_flat(comments, user_id: int):
+    # То, что возвращают два запроса CommentService.get_discussion
+    rows = [
+        FlatRow(c.id, c.text, c.author.nickname, c.author.id, c.created_at, c.like_count,
+                c.parent.id if c.parent else None)
+        for c in sorted(comments, key=lambda x: (x.created_at, x.id), reverse=True)
+    ]
+
+    # Поиск лайков пользователя входит в замер, как и скан liked_by в старом дереве
+    start = time.perf_counter()
+    liked_ids = {c.id for c in comments if any(u.id == user_id for u in c.liked_by)}
+    build_comment_forest(rows, liked_ids)
+    return time.perf_counter() - start
+
+
+def measure(func, repeat: int) -> Optional[float]:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            func()
+        except RecursionError:
+            return None
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comment tree builder benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--shapes", nargs="+", default=["random", "chain"], choices=["random", "chain"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    user_id = 1
+    print(f"{'shape':<8}{'comments':>10}{'legacy, ms':>14}{'flat, ms':>12}{'speedup':>10}")
+    for shape in args.shapes:
+        for size in args.sizes:
+            comments = generate_thread(size, shape)
+
+            legacy = measure(lambda: run_legacy(comments, user_id), args.repeat)
+            flat = min(run_flat(comments, user_id) for _ in range(args.repeat))
+
+            legacy_ms = f"{legacy * 1000:.1f}" if legacy is not None else "Recursion"
+            speedup = f"{legacy / flat:.1f}x" if legacy is not None and flat else "-"
+            print(f"{shape:<8}{size:>10}{legacy_ms:>14}{flat * 1000:>12.1f}{speedup:>10}")
+
+    print(f"\nrecursion limit: {sys.getrecursionlimit()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import asyncio
+import json
+import logging
+
+from config.database import AsyncSessionLocal, engine
+
+
+async def rebuild_index():
+    """Полная переиндексация путеводителей (нужна при смене модели эмбеддингов)"""
+    from services.RecommendationService import RecommendationService
+
+    recommendation_service = RecommendationService()
+    try:
+        async with AsyncSessionLocal() as db:
+            indexed_count = await recommendation_service.index_all_guides(db)
+    finally:
+        # Потоки пула не демонические - без shutdown процесс не завершится
+        recommendation_service.close()
+    print(f"Indexed {indexed_count} guides")
+
+
+async def reconcile_index():
+    """Сверка индекса с БД без полной переиндексации"""
+    from services.RecommendationService import RecommendationService
+
+    recommendation_service = RecommendationService()
+    try:
+        async with AsyncSessionLocal() as db:
+            report = await recommendation_service.reconcile_index(db)
+    finally:
+        recommendation_service.close()
+    print(json.dumps(report.as_dict(), indent=2))
+
+
+async def purge_refresh_tokens():
+    """Разовая очистка истекших и отозванных refresh-токенов"""
+    from services.TokenCleanupService import TokenCleanupService
+
+    purged = await TokenCleanupService(AsyncSessionLocal).purge()
+    print(f"Purged {purged} refresh tokens")
+
+
+async def reconcile_like_counts():
+    """Пересчет like_count путеводителей и комментариев по таблицам лайков"""
+    from services.LikeService import LikeService
+
+    async with AsyncSessionLocal() as db:
+        repaired = await LikeService.reconcile_like_counts(db)
+    print(f"Repaired {repaired} like counters")
+
+
+async def migrate_storage():
+    """Перенос файлов старых путеводителей (content/...) в хранилище объектов"""
+    from services.GuideService import GuideService
+    from services.StorageService import storage
+
+    try:
+        async with AsyncSessionLocal() as db:
+            migrated = await GuideService.migrate_to_storage(db)
+    finally:
+        await storage.close()
+    print(f"Migrated {migrated} guides")
+
+
+async def purge_storage():
+    """Разовое удаление объектов хранилища, на которые дольше паузы не ссылается ни один путеводитель"""
+    from services.StorageCleanupService import StorageCleanupService
+    from services.StorageService import storage
+
+    try:
+        purged = await StorageCleanupService(AsyncSessionLocal).purge()
+    finally:
+        await storage.close()
+    print(f"Purged {purged} stored objects")
+
+
+COMMANDS = {
+    "rebuild-index": rebuild_index,
+    "reconcile-index": reconcile_index,
+    "purge-refresh-tokens": purge_refresh_tokens,
+    "reconcile-like-counts": reconcile_like_counts,
+    "migrate-storage": migrate_storage,
+    "purge-storage": purge_storage,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TripGuideAPI admin commands")
+    parser.add_argument("command", choices=COMMANDS.keys())
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def run():
+        try:
+            await COMMANDS[args.command]()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
+
+#* Пример: python cli.py rebuild-index
@@ -1,3 +1,5 @@
+from typing import Dict
+
 from pydantic_settings import BaseSettings
 
 class AppSettings(BaseSettings):
@@ -30,6 +32,111 @@ class AppSettings(BaseSettings):
  
     CATBOX_USERHASH: str = '14f072556bee81c3367d8d027'
 
+    # Хостинг изображений для /guide/guide_image: catbox или local (офлайн-замена)
+    IMAGE_HOST_BACKEND: str = "catbox"
+    IMAGE_HOST_URL: str = "https://catbox.moe/user/api.php"
+    IMAGE_HOST_TIMEOUT_SECONDS: float = 60.0
+    IMAGE_HOST_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    IMAGE_HOST_MAX_CONNECTIONS: int = 20
+    IMAGE_HOST_MAX_KEEPALIVE: int = 10
+    IMAGE_HOST_RETRIES: int = 2
+    IMAGE_HOST_BACKOFF_SECONDS: float = 0.5
+    IMAGE_HOST_LOCAL_BASE_URL: str = ""
+    IMAGE_HOST_LOCAL_MAX_BYTES: int = 20 * 1024 * 1024
+
+    CATALOG_PAGE_SIZE: int = 20
+    CATALOG_MAX_PAGE_SIZE: int = 100
+
+    # Обсуждения: страница корневых комментариев, ответов на уровень и максимальная глубина ответов
+    COMMENTS_PAGE_SIZE: int = 20
+    COMMENTS_MAX_PAGE_SIZE: int = 100
+    COMMENTS_REPLIES_PAGE_SIZE: int = 5
+    COMMENTS_MAX_DEPTH: int = 3
+
+    # Кэш общей части страниц путеводителей (метаданные, markdown, обсуждение)
+    GUIDE_PAGE_CACHE_SIZE: int = 1000
+    GUIDE_PAGE_CACHE_TTL_SECONDS: int = 60
+
+    # Кэш markdown-файлов путеводителей: общий объем
+    MARKDOWN_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # Пререндер HTML путеводителей и его сжатых вариантов
+    CONTENT_RENDER_WORKERS: int = 2
+    CONTENT_BROTLI_QUALITY: int = 11
+
+    # Загрузка файлов: размер чанка и лимиты
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    MAX_GUIDE_LOGO_BYTES: int = 10 * 1024 * 1024
+    MAX_AVATAR_BYTES: int = 5 * 1024 * 1024
+
+    # Хранилище контента путеводителей: local (каталог) или s3 (S3-совместимое, например MinIO)
+    STORAGE_BACKEND: str = "local"
+    STORAGE_LOCAL_ROOT: str = "content"
+    # Локальные копии объектов S3 и их производные (HTML, уменьшенные копии)
+    STORAGE_CACHE_DIR: str = "storage_cache"
+    STORAGE_S3_ENDPOINT_URL: str = ""
+    STORAGE_S3_REGION: str = "us-east-1"
+    STORAGE_S3_BUCKET: str = "tripguide"
+    STORAGE_S3_ACCESS_KEY: str = ""
+    STORAGE_S3_SECRET_KEY: str = ""
+    STORAGE_S3_MAX_CONNECTIONS: int = 20
+    # Сборщик объектов без ссылок: удаляет объект, если ссылок нет дольше паузы
+    STORAGE_GC_GRACE_SECONDS: int = 3600
+    STORAGE_GC_INTERVAL_SECONDS: int = 600
+    STORAGE_GC_BATCH_SIZE: int = 100
+
+    # Отдача медиа: Cache-Control для изменяемых файлов и срок жизни файлов с хэшем в имени
+    MEDIA_CACHE_CONTROL: str = "no-cache"
+    MEDIA_IMMUTABLE_MAX_AGE: int = 31536000
+    # Кэш путей аватаров (ник/id -> файл), чтобы не ходить в БД
+    AVATAR_PATH_CACHE_SIZE: int = 10000
+    AVATAR_PATH_CACHE_TTL_SECONDS: int = 300
+
+    # Уменьшенные копии логотипов и аватаров: имя размера -> максимальная сторона в пикселях
+    IMAGE_SIZES: Dict[str, int] = {"thumb": 160, "card": 480, "large": 1280}
+    IMAGE_QUALITY: int = 80
+    IMAGE_WORKERS: int = 2
+    IMAGE_VERSION_CACHE_SIZE: int = 10000
+    # Размер логотипа в карточках каталога, популярного и рекомендаций
+    LISTING_LOGO_SIZE: str = "card"
+
+    # False - модель эмбеддингов грузится при первом запросе к рекомендациям
+    RECOMMENDATIONS_PRELOAD_MODEL: bool = False
+    RECS_CACHE_SIZE: int = 10000
+    RECS_CACHE_TTL_SECONDS: int = 300
+    RECS_PAGE_SIZE: int = 10
+    RECS_MAX_PAGE_SIZE: int = 50
+    # Максимальная глубина выдачи (offset + limit)
+    RECS_MAX_WINDOW: int = 200
+    # Шаг окна кэшируемой выдачи: страницы внутри окна берутся из одного расчета
+    RECS_WINDOW_STEP: int = 50
+    # Период сверки счетчика путеводителей с БД (для нескольких воркеров)
+    GUIDE_COUNT_RESYNC_SECONDS: int = 300
+
+    # Кэш id тегов по имени (для сохранения путеводителей)
+    TAG_CACHE_SIZE: int = 10000
+    TAG_CACHE_TTL_SECONDS: int = 3600
+
+    # Контроль числа SQL-запросов на роут в рантайме: off / warn (предупреждение в лог)
+    QUERY_BUDGET_MODE: str = "off"
+
+    # bcrypt: стоимость хэширования и пул потоков для него
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+
+    # Очистка истекших/отозванных refresh-токенов
+    REFRESH_TOKEN_RETENTION_DAYS: int = 1
+    REFRESH_TOKEN_CLEANUP_INTERVAL_SECONDS: int = 3600
+    REFRESH_TOKEN_CLEANUP_BATCH_SIZE: int = 1000
+
+    # Счетчики лайков: atomic - UPDATE в каждом запросе, buffered - пакетный сброс дельт
+    # (в режиме buffered cli.py reconcile-like-counts запускается по расписанию, например cron)
+    LIKE_COUNTER_MODE: str = "atomic"
+    LIKE_COUNTER_FLUSH_INTERVAL_MS: int = 500
+    # Пауза между снимками расхождений при пересчете like_count (должна быть больше периода сброса)
+    LIKE_COUNT_RECONCILE_SETTLE_SECONDS: float = 5
+
     class Config:
         env_file = "../.env"
 
@@ -0,0 +1,37 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+
+# create_all не изменяет уже существующие таблицы, поэтому новые индексы/колонки
+# для старых БД добавляются здесь идемпотентными DDL-командами
+MIGRATIONS = [
+    "CREATE INDEX IF NOT EXISTS ix_guides_created_at_id ON guides (created_at, id)",
+    "ALTER TABLE refresh_tokens ADD COLUMN IF NOT EXISTS jti VARCHAR",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_refresh_tokens_jti ON refresh_tokens (jti)",
+    "CREATE INDEX IF NOT EXISTS ix_refresh_tokens_user_revoked_expires ON refresh_tokens (user_id, is_revoked, expires_at)",
+    "CREATE INDEX IF NOT EXISTS ix_refresh_tokens_expires_at ON refresh_tokens (expires_at)",
+    "CREATE INDEX IF NOT EXISTS ix_refresh_tokens_revoked_at ON refresh_tokens (revoked_at) WHERE is_revoked",
+    "CREATE INDEX IF NOT EXISTS ix_comments_guide_parent_created_id ON comments (guide_id, parent_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_comments_parent_created_id ON comments (parent_id, created_at, id)",
+    # Ключи хранилища дедуплицируются - уникальность пути markdown снимается
+    "ALTER TABLE guides DROP CONSTRAINT IF EXISTS guides_content_file_url_key",
+    "CREATE INDEX IF NOT EXISTS ix_guides_content_file_url ON guides (content_file_url)",
+    "CREATE INDEX IF NOT EXISTS ix_guides_head_image_url ON guides (head_image_url)",
+    "ALTER TABLE guides ADD COLUMN IF NOT EXISTS page_version INTEGER NOT NULL DEFAULT 0",
+    # Счетчики ссылок для ключей, записанных до появления stored_objects
+    """
+    INSERT INTO stored_objects (key, ref_count)
+    SELECT key, count(*) FROM (
+        SELECT content_file_url AS key FROM guides
+        UNION ALL
+        SELECT head_image_url FROM guides
+    ) refs
+    GROUP BY key
+    ON CONFLICT (key) DO NOTHING
+    """,
+]
+
+
+async def run_migrations(conn: AsyncConnection) -> None:
+    for statement in MIGRATIONS:
+        await conn.execute(text(statement))
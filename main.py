@@ -1,7 +1,6 @@
 from contextlib import asynccontextmanager
 import time
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
 import logging
@@ -11,15 +10,25 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from models.basemodel import BaseModel
 from config.appsettings import Settings
-from config.database import engine
+from config.database import engine, AsyncSessionLocal
+from config.migrations import run_migrations
 from config.config import uploads_dir, content_dir
 from middlewares.LoggerMiddleware import RequestLoggingMiddleware
+from middlewares.QueryBudgetMiddleware import QueryBudgetMiddleware
 from routes.auth import router as AuthRouter
 from routes.user import router as UserRouter
 from routes.guides import router as GuideRouter
 from routes.pages import router as PageRouter
 from routes.comments import router as CommentRouter
+from routes.metrics import router as MetricsRouter
 from services.RecommendationService import RecommendationService
+from services.TokenCleanupService import TokenCleanupService
+from services.StorageCleanupService import StorageCleanupService
+from services.LikeCounterBuffer import LikeCounterBuffer
+from services.ImageHostService import create_image_host
+from services.StorageService import storage
+from utils.query_counter import install_query_counter
+from utils.media import MediaStaticFiles
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -27,19 +36,24 @@ async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         # await conn.run_sync(BaseModel.metadata.drop_all)
         await conn.run_sync(BaseModel.metadata.create_all)
+        await run_migrations(conn)
         
     
-    # Инициализация сервиса рекомендаций
-    recommendation_service = RecommendationService()
+    # Инициализация сервиса рекомендаций (один экземпляр на процесс)
+    recommendation_service = RecommendationService(preload_model=Settings.RECOMMENDATIONS_PRELOAD_MODEL)
+    app.state.recommendation_service = recommendation_service
     
-    # Проверка и индексация путеводителей
+    # Сверка персистентного индекса с БД (полная переиндексация: python cli.py rebuild-index)
     db = AsyncSession(engine)
     try:
         start_time = time.time()
-        indexed_count = await recommendation_service.index_all_guides(db)
+        report = await recommendation_service.reconcile_index(db)
         elapsed = time.time() - start_time
         
-        logging.info(f"Initial indexing completed. Indexed {indexed_count} guides in {elapsed:.2f} seconds")
+        logging.info(
+            f"Index reconciliation completed in {elapsed:.2f} seconds. "
+            f"Added: {report.added}, updated: {report.updated}, removed: {report.removed}, unchanged: {report.unchanged}"
+        )
         
     except Exception as e:
         logging.critical(f"Failed to index guides on startup: {e}")
@@ -48,9 +62,35 @@ async def lifespan(app: FastAPI):
     finally:
         await db.close()
     
+    # Фоновая очистка refresh-токенов
+    token_cleanup = TokenCleanupService(AsyncSessionLocal)
+    token_cleanup.start()
+
+    # Фоновое удаление объектов хранилища без ссылок
+    storage_cleanup = StorageCleanupService(AsyncSessionLocal)
+    storage_cleanup.start()
+
+    # Буфер счетчиков лайков (только в режиме buffered; сверка - командой cli.py reconcile-like-counts)
+    like_counters = None
+    if Settings.LIKE_COUNTER_MODE == "buffered":
+        like_counters = LikeCounterBuffer(AsyncSessionLocal)
+        like_counters.start()
+    app.state.like_counter_buffer = like_counters
+
+    # Общий HTTP-клиент хостинга изображений (пул соединений на весь процесс)
+    image_host = create_image_host()
+    app.state.image_host = image_host
+
     yield  # Приложение работает
     
     # Завершение работы
+    await token_cleanup.stop()
+    await storage_cleanup.stop()
+    if like_counters is not None:
+        await like_counters.stop()
+    await image_host.close()
+    await storage.close()
+    recommendation_service.close()
     await engine.dispose()
     logging.info("Application shutdown completed")
 
@@ -83,6 +123,10 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+if Settings.QUERY_BUDGET_MODE == "warn":
+    install_query_counter(engine)
+    app.add_middleware(QueryBudgetMiddleware)
+
 app.add_middleware(
     RequestLoggingMiddleware,
     exclude_paths=["/docs", "/redoc"],  # Пути, которые не нужно логировать
@@ -94,9 +138,10 @@ app.include_router(UserRouter)
 app.include_router(GuideRouter)
 app.include_router(PageRouter)
 app.include_router(CommentRouter)
+app.include_router(MetricsRouter)
 
-app.mount("/uploads", StaticFiles(directory=uploads_dir), name="uploads")
+app.mount("/uploads", MediaStaticFiles(directory=uploads_dir), name="uploads")
 
-app.mount("/content", StaticFiles(directory=content_dir), name="content")
+app.mount("/content", MediaStaticFiles(directory=content_dir), name="content")
 
 #* Команда для запуска uvicorn main:app --reload
\ No newline at end of file
@@ -0,0 +1,54 @@
+import logging
+from typing import Callable, Dict, Optional
+
+from fastapi import Request, Response
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp
+
+from utils.query_counter import DEFAULT_QUERY_BUDGETS, start_counting
+
+
+logger = logging.getLogger("query_budget")
+
+
+class QueryBudgetMiddleware(BaseHTTPMiddleware):
+    """
+    Диагностика в рантайме (QUERY_BUDGET_MODE=warn): превышение бюджета SQL-запросов пишется в лог,
+    ответ не меняется. Сами бюджеты проверяются тестами tests/test_query_budgets.py
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        budgets: Dict[str, int] = None,
+        default_budget: Optional[int] = None
+    ):
+        """
+        Args:
+            app: ASGI приложение
+            budgets: Максимальное число SQL-запросов по шаблону пути роута
+            default_budget: Бюджет для роутов без явного значения (None - не проверять)
+        """
+        super().__init__(app)
+        self.budgets = budgets if budgets is not None else DEFAULT_QUERY_BUDGETS
+        self.default_budget = default_budget
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        counter = start_counting()
+
+        response = await call_next(request)
+
+        # После роутинга в scope лежит найденный роут с шаблоном пути
+        route = request.scope.get("route")
+        route_path = getattr(route, "path", request.url.path)
+        budget = self.budgets.get(route_path, self.default_budget)
+
+        if budget is not None and counter.count > budget:
+            logger.warning(
+                f"Query budget exceeded | {request.method} {route_path} | "
+                f"{counter.count} queries, budget {budget}"
+            )
+            for statement in counter.statements:
+                logger.debug(f"Query | {route_path} | {statement}")
+
+        return response
@@ -8,7 +8,8 @@ from .guides import Guides
 from .guidetags import GuideTags
 # from notifications import Notifications
 from .refreshtokens import RefreshTokens
+from .storedobjects import StoredObjects
 from .guideslikes import GuideLikes
 from .tags import Tags
-# from userrecom import UserRecom
+from .userrecom import UserRecom
 from .users import Users
\ No newline at end of file
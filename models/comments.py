@@ -1,10 +1,15 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Index, Integer, String, Text, DateTime, ForeignKey
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .basemodel import BaseModel
 
 class Comment(BaseModel):
     __tablename__ = 'comments'
+    __table_args__ = (
+        # Keyset-пагинация корневых комментариев путеводителя и ответов на комментарий
+        Index('ix_comments_guide_parent_created_id', 'guide_id', 'parent_id', 'created_at', 'id'),
+        Index('ix_comments_parent_created_id', 'parent_id', 'created_at', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     text = Column(Text, nullable=False)
@@ -15,22 +20,22 @@ class Comment(BaseModel):
     parent_id = Column(Integer, ForeignKey('comments.id'))
     
     # Relationships
-    guide = relationship("Guides", back_populates="comments", lazy="selectin")
-    author = relationship("Users", back_populates="comments", lazy="selectin")
+    guide = relationship("Guides", back_populates="comments", lazy="raise_on_sql")
+    author = relationship("Users", back_populates="comments", lazy="raise_on_sql")
     replies = relationship("Comment", 
                          back_populates="parent",
-                         lazy="selectin",
+                         lazy="raise_on_sql",
                          cascade="all, delete",
                          order_by="Comment.created_at")
     parent = relationship("Comment", 
                         back_populates="replies",
                         remote_side=[id],
-                        lazy="selectin")
+                        lazy="raise_on_sql")
     liked_by = relationship(
         "Users",
         secondary="comments_likes",
         back_populates="comment_likes",
-        lazy="selectin"
+        lazy="raise_on_sql"
     )
     
     def repr(self):
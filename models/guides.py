@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Boolean, DateTime
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -7,21 +7,31 @@ from .basemodel import BaseModel
 
 class Guides(BaseModel):
     __tablename__ = 'guides'
+    __table_args__ = (
+        # Keyset-пагинация каталога идет по (created_at, id)
+        Index('ix_guides_created_at_id', 'created_at', 'id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, nullable=False)
     description = Column(String)
 
-    created_at = Column(DateTime, default=datetime.utcnow())
+    created_at = Column(DateTime, default=datetime.utcnow)
     like_count = Column(Integer, default=0)
+    # Версия общей части страницы (ключ кэша GuidePageService): растет при правке и новых комментариях
+    page_version = Column(Integer, nullable=False, default=0, server_default="0")
 
-    content_file_url = Column(String, nullable=False, unique=True)
-    head_image_url = Column(String, nullable=False)
+    # Ключи объектов хранилища (см. StorageService). Одинаковый контент хранится один раз,
+    # поэтому ключ может быть общим у нескольких путеводителей; индексы - для проверки ссылок перед удалением
+    content_file_url = Column(String, nullable=False, index=True)
+    head_image_url = Column(String, nullable=False, index=True)
 
     author_id = Column(Integer, ForeignKey('users.id'))
-    author = relationship("Users", back_populates="guides", lazy="selectin")
+    # Связи не загружаются неявно (raise_on_sql): нужные подгружаются в запросе через selectinload/joinedload,
+    # иначе ленивая загрузка в async-сессии падает с MissingGreenlet и прячет N+1 от тестов бюджета запросов
+    author = relationship("Users", back_populates="guides", lazy="raise_on_sql")
 
     # guide_tags = relationship("GuideTag", back_populates="guide", cascade="all, delete-orphan")
-    tags = relationship("Tags", secondary="guide_tags", back_populates="guides", lazy="selectin")
-    liked_by = relationship("Users", secondary="guide_likes", back_populates="guide_likes", lazy="selectin")
-    comments = relationship("Comment", back_populates="guide", lazy="selectin")
\ No newline at end of file
+    tags = relationship("Tags", secondary="guide_tags", back_populates="guides", lazy="raise_on_sql")
+    liked_by = relationship("Users", secondary="guide_likes", back_populates="guide_likes", lazy="raise_on_sql")
+    comments = relationship("Comment", back_populates="guide", lazy="raise_on_sql")
\ No newline at end of file
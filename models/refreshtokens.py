@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Index, Integer, String, DateTime, Boolean, ForeignKey
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 import datetime
 
 from .basemodel import BaseModel
@@ -8,12 +8,22 @@ from .basemodel import BaseModel
 
 class RefreshTokens(BaseModel):
     __tablename__ = 'refresh_tokens'
+    __table_args__ = (
+        # Выборки активных токенов пользователя
+        Index('ix_refresh_tokens_user_revoked_expires', 'user_id', 'is_revoked', 'expires_at'),
+        # Очистка (TokenCleanupService): expires_at < cutoff OR (is_revoked AND revoked_at < cutoff) -
+        # по индексу на каждую ветку OR (BitmapOr)
+        Index('ix_refresh_tokens_expires_at', 'expires_at'),
+        Index('ix_refresh_tokens_revoked_at', 'revoked_at', postgresql_where=text('is_revoked')),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
 
+    # Для токенов с jti - HMAC-SHA256, для старых токенов без jti - bcrypt-хэш
     token = Column(String, unique=True, index=True, nullable=False)
+    jti = Column(String, unique=True, index=True, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    user = relationship("Users", back_populates="refresh_tokens")
+    user = relationship("Users", back_populates="refresh_tokens", lazy="raise_on_sql")
 
     expires_at = Column(DateTime, nullable=False)
     created_at = Column(DateTime, default=func.now(), nullable=False)
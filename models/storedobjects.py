@@ -0,0 +1,17 @@
+from sqlalchemy import Column, DateTime, Index, Integer, String
+
+from .basemodel import BaseModel
+
+
+class StoredObjects(BaseModel):
+    """Счетчик ссылок путеводителей на объект хранилища (ключи дедуплицируются и бывают общими)"""
+    __tablename__ = 'stored_objects'
+    __table_args__ = (
+        # Выборка объектов без ссылок для сборщика
+        Index('ix_stored_objects_orphaned_at', 'orphaned_at'),
+    )
+
+    key = Column(String, primary_key=True)
+    ref_count = Column(Integer, nullable=False, default=0)
+    # Когда ссылок не осталось; объект удаляется сборщиком после паузы
+    orphaned_at = Column(DateTime, nullable=True)
@@ -0,0 +1,21 @@
+from sqlalchemy import ARRAY, Column, DateTime, Float, ForeignKey, Integer
+from datetime import datetime
+
+from .basemodel import BaseModel
+
+
+class UserRecom(BaseModel):
+    """Вектор вкуса пользователя: сумма эмбеддингов лайкнутых путеводителей"""
+    __tablename__ = 'user_recom'
+
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    vector_sum = Column(ARRAY(Float), nullable=True)
+    likes_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def vector(self):
+        """Средний вектор для запроса в Chroma"""
+        if not self.vector_sum or not self.likes_count:
+            return None
+        return [value / self.likes_count for value in self.vector_sum]
@@ -24,12 +24,12 @@ class Users(BaseModel):
 
 
     # TODO Добавить сюда relationship 
-    refresh_tokens = relationship("RefreshTokens", back_populates="user", cascade="all, delete-orphan")
-    guides = relationship("Guides", back_populates="author", cascade="all, delete-orphan", lazy="selectin")
-    guide_likes = relationship("Guides", secondary="guide_likes", back_populates="liked_by", lazy="selectin")
-    comments = relationship("Comment", back_populates="author", lazy="selectin",  cascade="all, delete-orphan")
+    refresh_tokens = relationship("RefreshTokens", back_populates="user", cascade="all, delete-orphan", lazy="raise_on_sql")
+    guides = relationship("Guides", back_populates="author", cascade="all, delete-orphan", lazy="raise_on_sql")
+    guide_likes = relationship("Guides", secondary="guide_likes", back_populates="liked_by", lazy="raise_on_sql")
+    comments = relationship("Comment", back_populates="author", lazy="raise_on_sql",  cascade="all, delete-orphan")
     comment_likes = relationship(
         "Comment",
         secondary="comments_likes",
         back_populates="liked_by",
-        lazy="selectin")
\ No newline at end of file
+        lazy="raise_on_sql")
\ No newline at end of file
@@ -1,9 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
-from datetime import timedelta, datetime
+from datetime import datetime
 
-from config.appsettings import Settings
 from config.database import get_db
 from models.users import Users
 from models.refreshtokens import RefreshTokens
@@ -11,7 +10,7 @@ from schemas.auth import Token, TokenData, LoginRequest, Tokens
 from schemas.user import UserCreate, UserVerify
 from services.AuthService import AuthService
 from services.EmailService import EmailService
-from utils.current_user import get_current_user
+from utils.current_user import CurrentPrincipal, get_current_principal
 
 router = APIRouter(
     prefix='/auth',
@@ -36,7 +35,7 @@ async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
                 detail='User with this nickname already exists'
             )
         
-        hashed_password = AuthService.get_password_hash(user_data.password)
+        hashed_password = await AuthService.hash_password_async(user_data.password)
 
         verification_code = AuthService.generate_verification_code()
 
@@ -55,6 +54,9 @@ async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
 
         return {'message': 'User successfully created'}
     
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
         await db.rollback()
         raise HTTPException(
@@ -111,28 +113,18 @@ async def login(user_data: LoginRequest, db: AsyncSession = Depends(get_db)):
         )
 
         access_token = AuthService.create_jwt_token(token_data, 'access')
-        refresh_token = AuthService.create_jwt_token(token_data, 'refresh')
-
-        hashed_refresh_token = AuthService.get_password_hash(refresh_token)
-
-        refresh_token_expire = datetime.utcnow() + timedelta(days=Settings.REFRESH_TOKEN_EXPIRE_DAYS)
-
-
-        RefreshTokenDatabase = RefreshTokens(
-            token = hashed_refresh_token,
-            user_id = user.id,
-            expires_at = refresh_token_expire
-        )
-        db.add(RefreshTokenDatabase)
+        refresh_token = AuthService.issue_refresh_token(db, token_data)
         
         await db.commit()
-        await db.refresh(RefreshTokenDatabase)
 
         return {
             "access_token": access_token,
             "refresh_token": refresh_token,
             "token_type": 'bearer'}
     
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
         await db.rollback()
         raise HTTPException(
@@ -148,52 +140,62 @@ async def refresh_token(token: Token, db: AsyncSession = Depends(get_db)):
         refresh_token = token.token
         # Декодируем и проверяем тип токена
         token_data = AuthService.decode_jwt_token(refresh_token, 'refresh')
+        user_id = int(token_data.sub)
+
+        if token_data.jti:
+            # Один индексный поиск по jti и одно сравнение HMAC за константное время
+            stmt = select(RefreshTokens).where(RefreshTokens.jti == token_data.jti)
+            stored_token = (await db.execute(stmt)).scalar_one_or_none()
+
+            matched_token = stored_token if (
+                stored_token
+                and stored_token.user_id == user_id
+                and stored_token.is_valid
+                and AuthService.verify_refresh_token(refresh_token, stored_token.token)
+            ) else None
+        else:
+            # Токены, выданные до появления jti: старая проверка bcrypt только среди записей без jti.
+            # После ротации пользователь получает токен с jti, и этот путь перестает использоваться
+            stmt = select(RefreshTokens).where(
+                RefreshTokens.user_id == user_id,
+                RefreshTokens.jti.is_(None),
+                RefreshTokens.is_revoked == False
+            )
+            result = await db.execute(stmt)
+            legacy_tokens = result.scalars().all()
 
-        # Получаем пользователя
-        user = await AuthService.get_user_by_id(db, int(token_data.sub))
-        if not user:
-            raise HTTPException(status_code=404, detail='User not found')
-
-        # Ищем среди токенов совпадение по хэшу
-        stmt = select(RefreshTokens).where(
-            RefreshTokens.user_id == user.id,
-            RefreshTokens.is_revoked == False
-        )
-        result = await db.execute(stmt)
-        active_tokens = result.scalars().all()
-
-        matched_token = next(
-            (
-                t for t in active_tokens
-                if AuthService.verify_password(refresh_token, t.token) and t.is_valid
-            ),
-            None
-        )
+            matched_token = None
+            for legacy_token in legacy_tokens:
+                if legacy_token.is_valid and await AuthService.verify_password_async(refresh_token, legacy_token.token):
+                    matched_token = legacy_token
+                    break
 
 
         if not matched_token:
             raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
 
-        # Ревокация старого токена
-        matched_token.is_revoked = True
-        matched_token.revoked_at = datetime.utcnow()
+        # Атомарная ревокация старого токена: из параллельных обновлений с одним токеном
+        # строку отзывает только одно, остальные получают 401
+        now = datetime.utcnow()
+        token_filter = (
+            RefreshTokens.jti == token_data.jti if token_data.jti
+            else RefreshTokens.id == matched_token.id
+        )
+        revoked_id = await db.scalar(
+            update(RefreshTokens)
+            .where(token_filter, RefreshTokens.is_revoked == False, RefreshTokens.expires_at > now)
+            .values(is_revoked=True, revoked_at=now)
+            .returning(RefreshTokens.id)
+            .execution_options(synchronize_session=False)
+        )
+        if revoked_id is None:
+            raise HTTPException(status_code=401, detail="Invalid or expired refresh token")
 
-        # Создаём новые токены
+        # Создаём и сохраняем новые токены
         access_token = AuthService.create_jwt_token(token_data, 'access')
-        new_refresh_token = AuthService.create_jwt_token(token_data, 'refresh')
-        hashed_refresh_token = AuthService.get_password_hash(new_refresh_token)
-
-        # Сохраняем новый refresh token
-        expires_at = datetime.utcnow() + timedelta(days=Settings.REFRESH_TOKEN_EXPIRE_DAYS)
-        new_token_entry = RefreshTokens(
-            token=hashed_refresh_token,
-            user_id=user.id,
-            expires_at=expires_at
-        )
-        db.add(new_token_entry)
+        new_refresh_token = AuthService.issue_refresh_token(db, token_data)
 
         await db.commit()
-        await db.refresh(new_token_entry)
 
         return {
             "access_token": access_token,
@@ -201,6 +203,9 @@ async def refresh_token(token: Token, db: AsyncSession = Depends(get_db)):
             "token_type": "bearer"
         }
 
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
         await db.rollback()
         raise HTTPException(
@@ -253,7 +258,7 @@ async def change_password(user_data = UserCreate, db : AsyncSession = Depends(ge
                 detail=f"Password update forbidden"
             )
         
-        new_password = AuthService.get_password_hash(user_data.password)
+        new_password = await AuthService.hash_password_async(user_data.password)
         user.password = new_password
         user.permission_to_recovery = False
 
@@ -262,6 +267,9 @@ async def change_password(user_data = UserCreate, db : AsyncSession = Depends(ge
         
         return {"message" : "User password updated"}
 
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
         await db.rollback()
         raise HTTPException(
@@ -271,21 +279,17 @@ async def change_password(user_data = UserCreate, db : AsyncSession = Depends(ge
 
 
 @router.post('/logout', status_code=status.HTTP_202_ACCEPTED)
-async def logout(user: Users = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def logout(user: CurrentPrincipal = Depends(get_current_principal), db: AsyncSession = Depends(get_db)):
     try:
-        # Найти все активные токены пользователя
-        stmt = select(RefreshTokens).where(
-            RefreshTokens.user_id == user.id,
-            RefreshTokens.is_revoked == False
+        # Отозвать все активные токены пользователя одним UPDATE
+        await db.execute(
+            update(RefreshTokens)
+            .where(
+                RefreshTokens.user_id == user.id,
+                RefreshTokens.is_revoked == False
+            )
+            .values(is_revoked=True, revoked_at=datetime.utcnow())
         )
-        result = await db.execute(stmt)
-        active_tokens = result.scalars().all()
-        
-        # Отозвать все активные токены
-        current_time = datetime.utcnow()
-        for token in active_tokens:
-            token.is_revoked = True
-            token.revoked_at = current_time
         
         await db.commit()
         
@@ -1,34 +1,19 @@
-import os
-import re
-import shutil
-from typing import List
-import httpx
-import aiofiles
-from datetime import datetime
-from pathlib import Path
-from fastapi import APIRouter, Depends, Form, HTTPException, status, UploadFile, File
-from fastapi.responses import FileResponse
-from sqlalchemy import delete, exists, select
-from sqlalchemy.orm import selectinload
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-import logger
 
 from config.appsettings import Settings
 from config.database import get_db
-from config.config import content_dir
-from models.users import Users
-from models.guides import Guides
-from models.tags import Tags
-from schemas.guides import GuideBase
-from schemas.comment import CommentCreate, CommentResponse
-from models.guideslikes import GuideLikes
-from models.guidetags import GuideTags
+from schemas.comment import CommentCreate
 from models.comments import Comment
-from models.commentslikes import CommentsLikes
-from utils.current_user import get_current_user
-from utils.recommendation_service import get_recommendation_service
-from services.RecommendationService import RecommendationService
+from utils.current_user import CurrentPrincipal, get_current_principal, get_optional_principal
 from services.GuideService import GuideService
+from services.LikeService import LikeService
+from services.CommentService import CommentService
+from services.GuidePageService import GuidePageService
+from services.LikeCounterBuffer import LikeCounterBuffer
+from utils.like_counter import get_like_counter_buffer
 
 
 router = APIRouter(
@@ -40,7 +25,7 @@ router = APIRouter(
 
 @router.post("/add", status_code=status.HTTP_201_CREATED)
 async def create_comment(
-    data: CommentCreate, db: AsyncSession = Depends(get_db), user: Users = Depends(get_current_user)
+    data: CommentCreate, db: AsyncSession = Depends(get_db), user: CurrentPrincipal = Depends(get_current_principal)
 ): 
     try:
 
@@ -65,6 +50,8 @@ async def create_comment(
         )
         
         db.add(db_comment)
+        # Новый комментарий меняет дерево обсуждения в кэше страницы
+        await GuidePageService.bump_version(db, data.guide_id)
         await db.commit()
         await db.refresh(db_comment)
 
@@ -79,47 +66,96 @@ async def create_comment(
 
 @router.post("/like/{comment_id}", status_code=status.HTTP_202_ACCEPTED)
 async def like_comment(
-    comment_id: int, db: AsyncSession = Depends(get_db), user: Users = Depends(get_current_user)
+    comment_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: CurrentPrincipal = Depends(get_current_principal),
+    like_buffer: Optional[LikeCounterBuffer] = Depends(get_like_counter_buffer)
 ):
     try:
-        # Проверяем существование комментария
-        comment = await db.execute(
-            select(Comment).where(Comment.id == comment_id)
-        )
-        comment = comment.scalar_one_or_none()
-        
-        if not comment:
+        # Переключение лайка и счетчика одним атомарным запросом (или с буферизацией счетчика)
+        toggled = await LikeService.toggle_comment_like(db, comment_id, user.id, like_buffer)
+
+        if toggled is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Comment not found"
             )
-        
-        # Проверяем, есть ли уже лайк
-        existing_like = await db.execute(
-            select(CommentsLikes).where(
-                CommentsLikes.user_id == user.id,
-                CommentsLikes.comment_id == comment_id
-            )
-        )
-        existing_like = existing_like.scalar_one_or_none()
-        
-        if existing_like:
-            # Удаляем лайк
-            comment.like_count -= 1
-            await db.delete(existing_like)
-            await db.commit()
-            return {"liked": False, "like_count": comment.like_count}
-        else:
-            # Добавляем лайк
-            new_like = CommentsLikes(user_id=user.id, comment_id=comment_id)
-            db.add(new_like)
-            comment.like_count += 1
-            await db.commit()
-            return {"liked": True, "like_count": comment.like_count}
-            
+
+        liked, like_count = toggled
+        await db.commit()
+        return {"liked": liked, "like_count": like_count}
+
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
         await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Server error when trying to like comment: {e}"
-        )
\ No newline at end of file
+        )
+
+
+@router.get("/replies/{comment_id}", status_code=status.HTTP_200_OK)
+async def get_replies(
+    comment_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(Settings.COMMENTS_REPLIES_PAGE_SIZE, ge=1, le=Settings.COMMENTS_MAX_PAGE_SIZE),
+    depth: int = Query(1, ge=0, le=Settings.COMMENTS_MAX_DEPTH),
+    db: AsyncSession = Depends(get_db),
+    user: Optional[CurrentPrincipal] = Depends(get_optional_principal)
+):
+    """
+    Ответы на комментарий ("показать еще")
+    - cursor: replies_cursor комментария или next_cursor предыдущей страницы
+    """
+    try:
+        return await CommentService.get_replies(
+            db,
+            comment_id,
+            user_id=user.id if user else None,
+            cursor=cursor,
+            limit=limit,
+            depth=depth,
+            replies_limit=Settings.COMMENTS_REPLIES_PAGE_SIZE
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error while getting replies: {e}"
+        )
+
+
+@router.get("/{guide_id}", status_code=status.HTTP_200_OK)
+async def get_comments(
+    guide_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(Settings.COMMENTS_PAGE_SIZE, ge=1, le=Settings.COMMENTS_MAX_PAGE_SIZE),
+    depth: int = Query(Settings.COMMENTS_MAX_DEPTH, ge=0, le=Settings.COMMENTS_MAX_DEPTH),
+    db: AsyncSession = Depends(get_db),
+    user: Optional[CurrentPrincipal] = Depends(get_optional_principal)
+):
+    """
+    Обсуждение путеводителя с keyset-пагинацией корневых комментариев
+    - cursor: значение next_cursor из предыдущей страницы
+    - depth: сколько уровней ответов вложить (глубже - через /comments/replies/{comment_id})
+    """
+    try:
+        return await CommentService.get_thread(
+            db,
+            guide_id,
+            user_id=user.id if user else None,
+            cursor=cursor,
+            limit=limit,
+            depth=depth,
+            replies_limit=Settings.COMMENTS_REPLIES_PAGE_SIZE
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error while getting comments: {e}"
+        )
@@ -1,33 +1,37 @@
-import os
-import shutil
-from typing import List
-import httpx
-import aiofiles
-from datetime import datetime
-from pathlib import Path
-from fastapi import APIRouter, Depends, Form, HTTPException, status, UploadFile, File
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Form, Header, HTTPException, Response, status, UploadFile, File
 from fastapi.responses import FileResponse
-from sqlalchemy import delete, exists, select
+from sqlalchemy import delete, select
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.ext.asyncio import AsyncSession
-import logger
+import logging
 
-from config.appsettings import Settings
 from config.database import get_db
-from config.config import content_dir
-from models.users import Users
 from models.guides import Guides
 from models.tags import Tags
-from models.comments import Comment
-from models.commentslikes import CommentsLikes
 from schemas.guides import GuideBase
 from models.guideslikes import GuideLikes
 from models.guidetags import GuideTags
-from utils.current_user import get_current_user
-from utils.comments import build_comment_tree
+from utils.current_user import CurrentPrincipal, get_current_principal
 from utils.recommendation_service import get_recommendation_service
+from utils.get_limit import guide_counter
 from services.RecommendationService import RecommendationService
 from services.GuideService import GuideService
+from services.LikeService import LikeService
+from services.TagService import TagService
+from services.GuidePageService import GuidePageService
+from services.GuideContentService import GuideContentService
+from services.ImageService import ImageService
+from services.StorageService import storage
+from services.ImageHostService import ImageHostService
+from utils.image_host import get_image_host
+from utils.comments import apply_comment_likes
+from utils.media import is_not_modified, media_response
+from services.LikeCounterBuffer import LikeCounterBuffer
+from utils.like_counter import get_like_counter_buffer
+
+logger = logging.getLogger(__name__)
 
 
 router = APIRouter(
@@ -38,53 +42,63 @@ router = APIRouter(
 
     
 @router.post('/guide_image', status_code=status.HTTP_202_ACCEPTED)
-async def upload_guide_image(file : UploadFile = File(...)):
+async def upload_guide_image(
+    file : UploadFile = File(...),
+    image_host: ImageHostService = Depends(get_image_host)
+):
     try:
-        files = {
-            "fileToUpload": (file.filename, await file.read(), file.content_type)
-        }
-
-        data = {
-            "reqtype": "fileupload",
-            "userhash": Settings.CATBOX_USERHASH
-        }
-
-        async with httpx.AsyncClient() as client:
-            response = await client.post("https://catbox.moe/user/api.php", data=data, files=files)
-
-        if response.status_code != 200:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to upload to Catbox")
-
-        return {"image_url": response.text.strip()}
+        # Файл уходит потоково через общий пул соединений, с повторами при сбоях
+        return {"image_url": await image_host.upload(file)}
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Catbox upload failed: {e}")
 
-    # http://localhost/guide/get_guide_logo/{id}
+    # http://localhost/guide/get_guide_logo/{id}?size=card&v={версия}
 @router.get('/get_guide_logo/{guide_id}', response_class=FileResponse,  status_code=status.HTTP_200_OK)
-async def get_guide_logo(guide_id: int, db: AsyncSession = Depends(get_db)):
+async def get_guide_logo(
+    guide_id: int,
+    size: Optional[str] = None,
+    v: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Логотип путеводителя
+    - size: уменьшенная копия (thumb / card / large), формат выбирается по Accept (AVIF/WebP)
+    - v: версия содержимого; URL с актуальной версией кэшируется как immutable
+    """
     try:
-        guide = await GuideService.get_guide_by_id(db, guide_id)
-
+        ImageService.validate_size(size)
+        logo_key = await db.scalar(select(Guides.head_image_url).where(Guides.id == guide_id))
 
-        if not guide:
+        if not logo_key:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail='Guide not found'
             )
-        
-        logo_path = guide.head_image_url
 
-        #! Нету проверки на существование лого - могут быть ошибки
-        
-        headers = {
-        "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
-        "Pragma": "no-cache",
-        "Expires": "0"
-        }
+        try:
+            logo_path = await storage.local_path(logo_key)
+        except FileNotFoundError:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail='Guide logo not found'
+            )
+
+        variant = await ImageService.get_variant(logo_path, size, accept)
 
-        return FileResponse(logo_path, headers=headers)
+        return media_response(
+            variant.path,
+            if_none_match,
+            media_type=variant.media_type,
+            headers=ImageService.cache_headers(variant, v)
+        )
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -167,55 +181,46 @@ async def save_guide(
     logo: UploadFile = File(...),
     tags: List[str] = Form(...),
     db: AsyncSession = Depends(get_db),
-    user: Users = Depends(get_current_user),
+    user: CurrentPrincipal = Depends(get_current_principal),
     recommendation_service: RecommendationService = Depends(get_recommendation_service)
 ):
     try:
-        # Создание папки и сохранение файлов
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        guide_folder_name = GuideService.sanitize_folder_name(data.title, timestamp)
-        guide_path = content_dir / guide_folder_name
-        
-        md_path = GuideService.save_markdown_file(guide_path, data.markdown_text)
-        logo_path = GuideService.save_logo_file(guide_path, logo)
+        # Сохранение файлов в хранилище (ключи по хэшу содержимого, ссылки - в этой же транзакции)
+        markdown_object = await GuideService.save_markdown(db, data.markdown_text)
+        logo_object = await GuideService.save_logo(db, logo)
+
+        try:
+            await GuideService.build_content(markdown_object.key, data.markdown_text)
+        except Exception as e:
+            # Варианты соберутся при первом запросе контента
+            logger.error(f"Failed to render guide content {markdown_object.key}: {e}")
 
         # Создание путеводителя
         guide = Guides(
             title=data.title,
             description=data.description,
-            content_file_url=str(md_path),
-            head_image_url=str(logo_path),
+            content_file_url=markdown_object.key,
+            head_image_url=logo_object.key,
             author_id=user.id
         )
         db.add(guide)
         await db.flush()  # Получаем ID guide
 
-        # Обработка тегов
-        tag_objects = []
-        for tag_name in tags:
-            tag_name = tag_name.strip()
-            tag = await db.scalar(select(Tags).where(Tags.name == tag_name))
-            if not tag:
-                tag = Tags(name=tag_name)
-                db.add(tag)
-                await db.flush()
-            tag_objects.append(tag)
-
-        # Связи с тегами
-        db.add_all([
-            GuideTags(guide_id=guide.id, tag_id=tag.id) 
-            for tag in tag_objects
-        ])
+        # Теги: нормализация, пакетное создание недостающих и все связи одним запросом
+        tag_ids = await TagService.set_guide_tags(db, guide.id, tags)
 
         await db.commit()
+        guide_counter.increment()
 
         # Индексация нового путеводителя (после коммита)
         try:
-            # Явно загружаем теги для индексации
+            # Теги уже известны - подставляем их без повторной загрузки и без изменения истории
+            # (индексу нужны только имена, после этого сессия не сбрасывается)
             await db.refresh(guide)
-            guide.tags = tag_objects
+            set_committed_value(guide, "tags", [Tags(id=tag_id, name=name) for name, tag_id in tag_ids.items()])
             
             await recommendation_service.index_guide(guide)
+            recommendation_service.cache.invalidate_all()
         except Exception as e:
             logger.error(f"Failed to index guide {guide.id}: {e}")
             # Не прерываем выполнение, т.к. основное сохранение прошло успешно
@@ -225,6 +230,9 @@ async def save_guide(
             "guide_id": guide.id
         }
 
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
         await db.rollback()
         raise HTTPException(
@@ -237,10 +245,12 @@ async def edit_guide(
     guide_id: int,
     data: GuideBase = Depends(GuideBase.as_form),
     db: AsyncSession = Depends(get_db),
-    user: Users = Depends(get_current_user)):
+    user: CurrentPrincipal = Depends(get_current_principal),
+    recommendation_service: RecommendationService = Depends(get_recommendation_service)):
     
     try:
-        guide = await GuideService.get_guide_by_id(db, guide_id, user)
+        # Теги нужны для переиндексации
+        guide = await GuideService.get_guide_by_id(db, guide_id, user, options=(selectinload(Guides.tags),))
 
         if not guide:
             raise HTTPException(
@@ -251,8 +261,12 @@ async def edit_guide(
         
         if data.markdown_text is not None:
             try:
-                with open(guide.content_file_url, 'w', encoding='utf-8') as md_file:
-                    md_file.write(data.markdown_text)
+                # Новое содержимое - новый объект; ссылка на прежний снимается в этой же транзакции
+                markdown_object = await GuideService.save_markdown(db, data.markdown_text)
+                await GuideService.build_content(markdown_object.key, data.markdown_text)
+
+                await GuideService.release_files(db, guide.content_file_url)
+                guide.content_file_url = markdown_object.key
             
             except Exception as e:
                 raise HTTPException(
@@ -265,9 +279,15 @@ async def edit_guide(
         if data.description:
             guide.description = data.description
 
+        # Эмбеддинг путеводителя изменится - векторы вкуса лайкнувших пересоберутся лениво
+        await recommendation_service.invalidate_guide_likers(db, guide_id)
+        await GuidePageService.bump_version(db, guide_id)
 
         await db.commit()
-        await db.refresh(guide)
+
+        # Переиндексация измененного путеводителя
+        await recommendation_service.index_guide(guide)
+        recommendation_service.cache.invalidate_all()
 
         return {"message": "Guide updated successfully"}
             
@@ -279,7 +299,12 @@ async def edit_guide(
         )
             
 @router.delete("/delete/{guide_id}", status_code=status.HTTP_202_ACCEPTED)
-async def delete_guide(guide_id: int, db: AsyncSession = Depends(get_db), user: Users = Depends(get_current_user)):
+async def delete_guide(
+    guide_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: CurrentPrincipal = Depends(get_current_principal),
+    recommendation_service: RecommendationService = Depends(get_recommendation_service)
+):
     try:
         guide = await GuideService.get_guide_by_id(db, guide_id, user)
 
@@ -289,6 +314,8 @@ async def delete_guide(guide_id: int, db: AsyncSession = Depends(get_db), user:
                 detail='Deleting guide not found or not owned by user'
             )
         
+        await recommendation_service.invalidate_guide_likers(db, guide_id)
+
         await db.execute(
             delete(GuideLikes).where(GuideLikes.guide_id == guide_id)
         )
@@ -296,20 +323,18 @@ async def delete_guide(guide_id: int, db: AsyncSession = Depends(get_db), user:
             delete(GuideTags).where(GuideTags.guide_id == guide_id)
         )
         
-        content_path = os.path.dirname(guide.content_file_url)
-
-        if os.path.exists(content_path):
-            shutil.rmtree(content_path)
+        # Объекты без ссылок позже удалит сборщик хранилища
+        await GuideService.release_files(db, guide.content_file_url, guide.head_image_url)
 
         await db.delete(guide)
 
-        await db.execute(
-            delete(Tags).where(
-                ~exists().where(GuideTags.tag_id == Tags.id)
-            )
-        ) 
+        await TagService.delete_orphans(db)
 
         await db.commit()
+        guide_counter.increment(-1)
+
+        await recommendation_service.delete_guide(guide_id)
+        recommendation_service.cache.invalidate_all()
 
         return{"message": "Guide deleted successfully"} 
 
@@ -319,109 +344,155 @@ async def delete_guide(guide_id: int, db: AsyncSession = Depends(get_db), user:
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f'Error while deleting guide: {e}'
         )  
-@router.get("/read_guide/{guide_id}", status_code=status.HTTP_200_OK)
-async def read_guide(guide_id: int, db: AsyncSession = Depends(get_db), user: Users = Depends(get_current_user)):
+@router.get("/body/{guide_id}", status_code=status.HTTP_200_OK)
+async def get_guide_body(
+    guide_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Общая часть страницы путеводителя (без персональных флагов), кэшируется и отдается с ETag"""
     try:
-        result = await db.execute(
-            select(Guides)
-            .where(Guides.id == guide_id)
-            .options(
-                selectinload(Guides.author),
-                selectinload(Guides.tags),
-                selectinload(Guides.comments)
-                    .selectinload(Comment.author),  # автор комментария
-                selectinload(Guides.comments)
-                    .selectinload(Comment.liked_by),  # лайки на комментарии
-                selectinload(Guides.comments)
-                    .selectinload(Comment.replies)  # ответы на комментарии
-            )
+        page = await GuidePageService.get_page(db, guide_id)
+        if not page:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Guide not found")
+
+        headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+        if is_not_modified(if_none_match, page.etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        return Response(content=page.body, media_type="application/json", headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f'Error while reading guide: {e}'
         )
-        guide = result.scalar_one_or_none()
 
-        if not guide:
+
+@router.get("/content/{guide_id}", response_class=FileResponse, status_code=status.HTTP_200_OK)
+async def get_guide_content(
+    guide_id: int,
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """Пререндеренный HTML путеводителя в лучшей кодировке по Accept-Encoding"""
+    try:
+        content_key = await db.scalar(select(Guides.content_file_url).where(Guides.id == guide_id))
+        if not content_key:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Guide not found")
+
+        variant = await GuideContentService.get_variant(await storage.local_path(content_key), accept_encoding)
+
+        headers = {"Vary": "Accept-Encoding"}
+        if variant.encoding != "identity":
+            headers["Content-Encoding"] = variant.encoding
+
+        return media_response(
+            variant.path,
+            if_none_match,
+            etag=variant.etag,
+            cache_control="no-cache",
+            media_type="text/html; charset=utf-8",
+            headers=headers
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        print(e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f'Error while reading guide: {e}'
+            detail=f'Error while reading guide content: {e}'
         )
-    else:
 
-        try:
-            md_path = Path(guide.content_file_url)
-            async with aiofiles.open(md_path, mode="r", encoding="utf-8") as f:
-                markdown_text = await f.read()
-
-            is_liked = False
-
-            if user:
-                result = await db.execute(
-                    select(GuideLikes).where(
-                        GuideLikes.user_id == user.id,
-                        GuideLikes.guide_id == guide.id
-                    )
-                )
-                is_liked = result.scalar_one_or_none() is not None
-
-            discussion = [
-                build_comment_tree(comment, user.id if user else None)
-                for comment in sorted(
-                    [c for c in guide.comments if c.parent_id is None],
-                    key=lambda x: x.created_at,
-                    reverse=True
-                )
-            ]
-
-            return {
-                "guide": {
-                    "title": guide.title,
-                    "description": guide.description,
-                    "markdown_text": markdown_text,
-                    "author": guide.author.nickname,
-                    "liked_by_user": is_liked,
-                    "likes_count": guide.like_count,
-                    "tags": [tag.name for tag in guide.tags],
-                    "created_at": guide.created_at
-                },
-                "discussion":discussion
-            }
 
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Error reading guide file: {e}"
-            )
+@router.get("/overlay/{guide_id}", status_code=status.HTTP_200_OK)
+async def get_guide_overlay(
+    guide_id: int,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    user: CurrentPrincipal = Depends(get_current_principal)
+):
+    """Персональная часть страницы: лайк путеводителя и id лайкнутых комментариев"""
+    try:
+        response.headers["Cache-Control"] = "private, no-store"
+        return await GuidePageService.get_overlay(db, guide_id, user.id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f'Error while reading guide overlay: {e}'
+        )
 
-@router.post('/like/{guide_id}', status_code=status.HTTP_202_ACCEPTED)
-async def like_guide(guide_id: int, db: AsyncSession = Depends(get_db), user: Users = Depends(get_current_user)):
+
+@router.get("/read_guide/{guide_id}", status_code=status.HTTP_200_OK)
+async def read_guide(guide_id: int, db: AsyncSession = Depends(get_db), user: CurrentPrincipal = Depends(get_current_principal)):
+    # Прежний формат ответа: общая часть из кэша + персональные флаги и свежие счетчики лайков
     try:
-        result = await db.execute(
-            select(GuideLikes).where(GuideLikes.user_id == user.id, GuideLikes.guide_id == guide_id)
+        page = await GuidePageService.get_page(db, guide_id)
+
+        if not page:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Guide not found")
+
+        overlay = await GuidePageService.get_overlay(db, guide_id, user.id)
+        guide = page.data["guide"]
+
+        return {
+            "guide": {
+                "title": guide["title"],
+                "description": guide["description"],
+                "markdown_text": guide["markdown_text"],
+                "author": guide["author"],
+                "liked_by_user": overlay["liked_by_user"],
+                "likes_count": overlay["likes_count"],
+                "tags": guide["tags"],
+                "created_at": guide["created_at"]
+            },
+            "discussion": apply_comment_likes(
+                page.data["discussion"],
+                set(overlay["liked_comment_ids"]),
+                overlay["comment_like_counts"]
+            )
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f'Error while reading guide: {e}'
         )
-        existing = result.scalar_one_or_none()
 
-        guide = await GuideService.get_guide_by_id(db, guide_id)
+@router.post('/like/{guide_id}', status_code=status.HTTP_202_ACCEPTED)
+async def like_guide(
+    guide_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: CurrentPrincipal = Depends(get_current_principal),
+    recommendation_service: RecommendationService = Depends(get_recommendation_service),
+    like_buffer: Optional[LikeCounterBuffer] = Depends(get_like_counter_buffer)
+):
+    try:
+        # Переключение лайка и счетчика одним атомарным запросом (или с буферизацией счетчика)
+        toggled = await LikeService.toggle_guide_like(db, guide_id, user.id, like_buffer)
 
-        
-        if guide:
-            if existing:
-                guide.like_count-= 1
-                await db.delete(existing)
-                await db.commit()
-                return {"liked": False}
-            else:
-                like = GuideLikes(user_id=user.id, guide_id=guide.id)
-                db.add(like)
-                guide.like_count+= 1
-                await db.commit()
-                return {"liked": True}
-        else:
+        if toggled is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Guide not found"
             )
+
+        liked, like_count = toggled
+        await db.commit()
+
+        # Инкрементальное обновление вектора вкуса пользователя
+        await recommendation_service.update_user_profile(db, user.id, guide_id, liked)
+        recommendation_service.cache.invalidate_user(user.id)
+
+        return {"liked": liked, "like_count": like_count}
+
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Server error when trying to like: {e}"
@@ -0,0 +1,13 @@
+from fastapi import APIRouter, status
+
+from utils.metrics import metrics
+
+router = APIRouter(
+    tags=['metrics']
+)
+
+
+@router.get('/metrics', status_code=status.HTTP_200_OK)
+async def get_metrics():
+    """Снимок in-process метрик текущего воркера"""
+    return metrics.snapshot()
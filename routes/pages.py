@@ -1,17 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func, select, tuple_
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from config.appsettings import Settings
 from config.database import get_db
 from models.guideslikes import GuideLikes
-from models.users import Users
 from models.guides import Guides
 from models.tags import Tags
-from utils.current_user import get_current_user
+from models.guidetags import GuideTags
+from utils.current_user import CurrentPrincipal, get_current_principal
 from utils.recommendation_service import get_recommendation_service
 from utils.get_limit import get_limit
+from utils.pagination import encode_cursor, decode_cursor
 from services.RecommendationService import RecommendationService
+from services.ImageService import ImageService
 
 router = APIRouter(
     tags=['pages']
@@ -21,33 +25,80 @@ router = APIRouter(
 # TODO Тут короче будут роуты для того чтобы выводить на фронт карточки путеводителей. Надо для рекомендаций, каталога, главной и профиля
 
 @router.get('/catalog', status_code=status.HTTP_200_OK)
-async def get_catalog(db: AsyncSession = Depends(get_db)):
+async def get_catalog(
+    cursor: Optional[str] = None,
+    limit: int = Query(Settings.CATALOG_PAGE_SIZE, ge=1, le=Settings.CATALOG_MAX_PAGE_SIZE),
+    tags: Optional[List[str]] = Query(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Каталог с keyset-пагинацией по (created_at, id)
+    - cursor: значение next_cursor из предыдущей страницы
+    - tags: фильтр, путеводитель должен содержать все указанные теги
+    """
     try:
-        result = await db.execute(
-            select(Guides)
-            .options(
-                selectinload(Guides.tags),
-            )
-            .order_by(Guides.created_at.desc())
+        # Выбираем только поля карточки, без загрузки ORM-объектов
+        stmt = (
+            select(Guides.id, Guides.title, Guides.description, Guides.created_at, Guides.head_image_url)
+            .order_by(Guides.created_at.desc(), Guides.id.desc())
+            .limit(limit + 1)
         )
-        guides = result.scalars().all()
 
-        # Получаем все уникальные теги
-        tags_result = await db.execute(select(Tags.name).distinct())
-        all_tags = [row.name for row in tags_result.fetchall()]
+        if cursor:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+            stmt = stmt.where(tuple_(Guides.created_at, Guides.id) < tuple_(cursor_created_at, cursor_id))
 
-        return {
+        tag_filter = sorted({tag.strip() for tag in tags or [] if tag.strip()})
+        if tag_filter:
+            tagged_guides = (
+                select(GuideTags.guide_id)
+                .join(Tags, Tags.id == GuideTags.tag_id)
+                .where(Tags.name.in_(tag_filter))
+                .group_by(GuideTags.guide_id)
+                .having(func.count(Tags.id) == len(tag_filter))
+            )
+            stmt = stmt.where(Guides.id.in_(tagged_guides))
+
+        rows = (await db.execute(stmt)).all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        # Теги только для путеводителей текущей страницы
+        guide_tags = {row.id: [] for row in rows}
+        if guide_tags:
+            tags_result = await db.execute(
+                select(GuideTags.guide_id, Tags.name)
+                .join(Tags, Tags.id == GuideTags.tag_id)
+                .where(GuideTags.guide_id.in_(guide_tags.keys()))
+            )
+            for guide_id, tag_name in tags_result.all():
+                guide_tags[guide_id].append(tag_name)
+
+        logo_urls = await ImageService.guide_logo_urls(rows)
+
+        response = {
             "guides": [
                 {
-                    "id": guide.id,
-                    "title": guide.title,
-                    "description": guide.description,
-                    "guide_tags": [tag.name for tag in guide.tags]
+                    "id": row.id,
+                    "title": row.title,
+                    "description": row.description,
+                    "logo_url": logo_urls[row.id],
+                    "guide_tags": guide_tags[row.id]
                 }
-                for guide in guides
+                for row in rows
             ],
-            "tags": all_tags
+            "next_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
         }
+
+        # Список всех тегов для фильтров нужен только на первой странице
+        if not cursor:
+            tags_result = await db.execute(select(Tags.name).distinct())
+            response["tags"] = [row.name for row in tags_result.fetchall()]
+
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -61,11 +112,13 @@ async def get_popular(db: AsyncSession = Depends(get_db)):
         result = await db.execute(
             select(Guides)
             .options(
-                selectinload(Guides.tags)
+                selectinload(Guides.tags),
+                selectinload(Guides.author)
             )
             .order_by(Guides.like_count.desc()).limit(3)
         )
         guides = result.scalars().all()
+        logo_urls = await ImageService.guide_logo_urls(guides)
 
         return {
             "guides": [
@@ -73,6 +126,7 @@ async def get_popular(db: AsyncSession = Depends(get_db)):
                     "id": guide.id,
                     "title": guide.title,
                     "description" : guide.description,
+                    "logo_url": logo_urls[guide.id],
                     "author": guide.author.nickname,
                     "created_at": guide.created_at,
                     "guide_tags": [tag.name for tag in guide.tags]
@@ -87,7 +141,7 @@ async def get_popular(db: AsyncSession = Depends(get_db)):
         )
 
 @router.get('/profile', status_code=status.HTTP_200_OK)
-async def get_profile(db: AsyncSession = Depends(get_db), user: Users = Depends(get_current_user)):
+async def get_profile(db: AsyncSession = Depends(get_db), user: CurrentPrincipal = Depends(get_current_principal)):
     try:
 
         result = await db.execute(
@@ -139,25 +193,33 @@ async def get_profile(db: AsyncSession = Depends(get_db), user: Users = Depends(
 @router.get("/recs", status_code=status.HTTP_200_OK)
 async def get_recommendations(
     limit: int = Depends(get_limit), 
+    offset: int = Query(0, ge=0),
     db: AsyncSession = Depends(get_db), 
-    user: Users = Depends(get_current_user),
+    user: CurrentPrincipal = Depends(get_current_principal),
     recommendation_service: RecommendationService = Depends(get_recommendation_service)
 ):
     """
     Получение персонализированных рекомендаций для авторизованного пользователя
     Возвращает:
     - recommendations: список рекомендованных путеводителей с их тегами
+    - next_offset: offset следующей страницы или None
     """
     try:
+        # Глубина выдачи ограничена, чтобы стоимость запроса не росла вместе с каталогом
+        limit = min(limit, max(Settings.RECS_MAX_WINDOW - offset, 0))
+        if not limit:
+            return {"recommendations": [], "next_offset": None}
+
         # Получаем рекомендации через сервис
         guide_ids = await recommendation_service.get_user_recommendations(
             db=db,
             user_id=user.id,
-            limit=limit
+            limit=limit,
+            offset=offset
         )
         
         if not guide_ids:
-            return {"recommendations": []}
+            return {"recommendations": [], "next_offset": None}
         
         # Получаем полную информацию о путеводителях одним запросом
         stmt = (
@@ -170,6 +232,7 @@ async def get_recommendations(
         
         # Создаем словарь для быстрого доступа по ID
         guides_dict = {guide.id: guide for guide in guides}
+        logo_urls = await ImageService.guide_logo_urls(guides)
         
         # Формируем ответ, сохраняя порядок рекомендаций
         recommendations = []
@@ -180,12 +243,15 @@ async def get_recommendations(
                     "id": guide.id,
                     "title": guide.title,
                     "description": guide.description,
+                    "logo_url": logo_urls[guide.id],
                     "tags": [tag.name for tag in guide.tags],
                     "created_at": guide.created_at,
                     "like_count": guide.like_count
                 })
         
-        return {"recommendations": recommendations}
+        next_offset = offset + limit if len(guide_ids) == limit and offset + limit < Settings.RECS_MAX_WINDOW else None
+
+        return {"recommendations": recommendations, "next_offset": next_offset}
     
     except HTTPException:
         raise
@@ -1,8 +1,8 @@
 import os
-import shutil
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+import re
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status, UploadFile, File
 from fastapi.responses import FileResponse
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config.appsettings import Settings
@@ -10,13 +10,19 @@ from config.database import get_db
 from config.config import uploads_dir
 from models.users import Users
 from schemas.user import UserInfo
-from utils.current_user import get_current_user
+from utils.current_user import CurrentPrincipal, get_current_principal, get_current_user
+from utils.avatars import get_avatar_path, invalidate_avatar_path
+from utils.media import media_response
+from utils.uploads import save_upload
+from services.ImageService import ImageService
 
 router = APIRouter(
     prefix='/user',
     tags=['user']
 )
 
+AVATAR_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png"}
+
 
 # Маршрут для обновления информации о пользователе в личном кабе -> настройки
 @router.post('/info', status_code=status.HTTP_202_ACCEPTED)
@@ -27,6 +33,7 @@ async def load_user_info(
 ):
     try:
         data = user_data.dict(exclude_unset=True)
+        previous_nickname = user.nickname
 
         for key, value in data.items():
             if isinstance(value, str):
@@ -41,6 +48,8 @@ async def load_user_info(
             setattr(user, key, value)
 
         await db.commit()
+        # Ник мог измениться - путь аватара по старому нику больше не действителен
+        invalidate_avatar_path(user.id, previous_nickname, user.nickname)
         return {"message": "User info updated"}
 
     except Exception as e:
@@ -76,28 +85,43 @@ async def upload_avatar(
     user: Users = Depends(get_current_user), 
     db: AsyncSession = Depends(get_db)
 ):
-    # Проверка типа файла
-    if file.content_type not in ["image/jpeg", "image/png"]:
+    # Проверка типа файла; расширение берется из проверенного типа, а не из имени файла клиента
+    extension = AVATAR_EXTENSIONS.get(file.content_type)
+    if extension is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail='Unsupported image type. Only JPEG and PNG are allowed.'
         )
     
     try:
-        # Создаем имя файла на основе никнейма пользователя
-        filename = f"{user.nickname}_avatar.{file.filename.split('.')[-1]}"
-        file_path = uploads_dir / filename
+        # Создаем имя файла на основе никнейма пользователя, к нему добавится хэш содержимого
+        # Ник тоже санитизируется: имя не должно содержать разделителей пути
+        safe_nickname = re.sub(r'[^\w-]+', '_', user.nickname).strip('_') or str(user.id)
+        filename = f"{safe_nickname}_avatar{extension}"
         
-        # Сохраняем файл
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Сохраняем файл потоково, вне event loop
+        file_path = await save_upload(
+            file, uploads_dir / filename, Settings.MAX_AVATAR_BYTES, kind="avatar", content_addressed=True
+        )
+        filename = file_path.name
+        previous_avatar = user.avatar_url
         
         # Обновляем путь к аватару в базе данных
         user.avatar_url = filename
         await db.commit()
+        invalidate_avatar_path(user.id, user.nickname)
+
+        # Прежний файл и его уменьшенные копии больше не нужны
+        if previous_avatar not in ('default.jpg', filename):
+            previous_path = uploads_dir / previous_avatar
+            previous_path.unlink(missing_ok=True)
+            ImageService.remove_variants(previous_path)
         
         return {"message": "Avatar uploaded successfully", "avatar_url": filename}
     
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
         await db.rollback()
         raise HTTPException(
@@ -107,33 +131,43 @@ async def upload_avatar(
     
 # Маршрут для получения аватарки по нику 
 @router.get('/avatar/{nickname}', response_class=FileResponse)
-async def get_avatar(nickname: str, db: AsyncSession = Depends(get_db)):
+async def get_avatar(
+    nickname: str,
+    size: Optional[str] = None,
+    v: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Аватар пользователя
+    - size: уменьшенная копия (thumb / card / large), формат выбирается по Accept (AVIF/WebP)
+    - v: версия содержимого; URL с актуальной версией кэшируется как immutable
+    """
     try:
-        stmt = select(Users).where(Users.nickname == nickname)
-        result = await db.execute(stmt)
-        user = result.scalars().first()
+        ImageService.validate_size(size)
+        avatar_path = await get_avatar_path(db, nickname=nickname)
 
-        if not user:
+        if not avatar_path:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
 
-        avatar_path = uploads_dir / user.avatar_url
-
         if not avatar_path.exists():
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Avatar file not found"
             )
 
-        headers = {
-        "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
-        "Pragma": "no-cache",
-        "Expires": "0"
-        }
-    
-        return FileResponse(avatar_path, headers=headers)
+        variant = await ImageService.get_variant(avatar_path, size, accept)
+
+        return media_response(
+            variant.path,
+            if_none_match,
+            media_type=variant.media_type,
+            headers=ImageService.cache_headers(variant, v)
+        )
 
 
     except HTTPException:
@@ -146,18 +180,23 @@ async def get_avatar(nickname: str, db: AsyncSession = Depends(get_db)):
 
 #Маршрут для получения аватарки по токену
 @router.get('/my_avatar', response_class=FileResponse)
-async def get_my_avatar(user: Users = Depends(get_current_user)):
+async def get_my_avatar(
+    if_none_match: Optional[str] = Header(None),
+    user: CurrentPrincipal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
     try:
-        avatar_path = uploads_dir / user.avatar_url
+        # Путь берется из кэша, в БД - только при промахе
+        avatar_path = await get_avatar_path(db, user_id=user.id)
 
-
-        if not avatar_path.exists():
+        if not avatar_path or not avatar_path.exists():
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Avatar file not found"
             )
 
-        return FileResponse(avatar_path)
+        # URL не версионирован - ответ приватный и ревалидируется по ETag
+        return media_response(avatar_path, if_none_match, cache_control="private, no-cache")
 
     except HTTPException:
         raise
@@ -173,8 +212,10 @@ async def delete_avatar(user: Users = Depends(get_current_user), db: AsyncSessio
         if user.avatar_url != 'default.jpg':
             avatar_path = uploads_dir / user.avatar_url
             os.remove(avatar_path)
+            ImageService.remove_variants(avatar_path)
             user.avatar_url = 'default.jpg'
             await db.commit()
+            invalidate_avatar_path(user.id, user.nickname)
 
         else:
             raise HTTPException(
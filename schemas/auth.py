@@ -8,6 +8,7 @@ class TokenData(BaseModel):
     exp: Optional[int] = None
     iat: Optional[int] = None
     token_type: Optional[str] = None
+    jti: Optional[str] = None  # Идентификатор refresh-токена
 
     @model_validator(mode='after')
     def validate_subject(self):
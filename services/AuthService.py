@@ -1,7 +1,9 @@
 from config.appsettings import Settings
 from config.database import get_db
 from models.users import Users
+from models.refreshtokens import RefreshTokens
 from schemas.auth import TokenData
+from utils.executor import BoundedExecutor, ExecutorSaturated
 
 from passlib.context import CryptContext
 from jose import JWTError, jwt, ExpiredSignatureError
@@ -12,6 +14,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from pydantic import ValidationError
 from datetime import timedelta, datetime
+import hashlib
+import hmac
 import secrets
 import string
 import logging
@@ -21,8 +25,14 @@ logger = logging.getLogger(__name__)
 
 class AuthService:
 
-    pwdContext = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwdContext = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=Settings.BCRYPT_ROUNDS)
 
+    # bcrypt отпускает GIL, поэтому хэширование в потоках не блокирует event loop
+    _hashing_executor = BoundedExecutor(
+        "password_hashing",
+        Settings.PASSWORD_HASH_WORKERS,
+        max_queue=Settings.PASSWORD_HASH_MAX_QUEUE
+    )
 
     @staticmethod
     def get_password_hash(password: str) -> str:
@@ -32,6 +42,50 @@ class AuthService:
     def verify_password(password, hashed_password) -> bool:
         return AuthService.pwdContext.verify(password, hashed_password)
 
+    @staticmethod
+    async def hash_password_async(password: str) -> str:
+        return await AuthService._run_hashing(AuthService.get_password_hash, password)
+
+    @staticmethod
+    async def verify_password_async(password, hashed_password) -> bool:
+        return await AuthService._run_hashing(AuthService.verify_password, password, hashed_password)
+
+    @staticmethod
+    async def _run_hashing(func, *args):
+        try:
+            return await AuthService._hashing_executor.run(func, *args)
+        except ExecutorSaturated:
+            # Всплеск логинов не должен занимать воркер целиком - отказываем сразу
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='Too many authentication requests, try again later',
+                headers={'Retry-After': '1'}
+            )
+
+    @staticmethod
+    def hash_refresh_token(token: str) -> str:
+        """Быстрый keyed-хэш refresh-токена (сам токен уже случайный, bcrypt не нужен)"""
+        return hmac.new(Settings.REFRESH_SECRET_KEY.encode(), token.encode(), hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def verify_refresh_token(token: str, token_hash: str) -> bool:
+        return hmac.compare_digest(AuthService.hash_refresh_token(token), token_hash)
+
+    @staticmethod
+    def issue_refresh_token(db: AsyncSession, token_data: TokenData) -> str:
+        """Создание refresh-токена с уникальным jti и добавление его записи в сессию (commit на вызывающем)"""
+        jti = secrets.token_urlsafe(24)
+        refresh_token = AuthService.create_jwt_token(token_data.model_copy(update={'jti': jti}), 'refresh')
+
+        db.add(RefreshTokens(
+            jti=jti,
+            token=AuthService.hash_refresh_token(refresh_token),
+            user_id=int(token_data.sub),
+            expires_at=datetime.utcnow() + timedelta(days=Settings.REFRESH_TOKEN_EXPIRE_DAYS)
+        ))
+
+        return refresh_token
+
     @staticmethod
     def generate_verification_code(length=6) -> str:
         alphabet = string.ascii_uppercase + string.digits
@@ -54,6 +108,8 @@ class AuthService:
 
         to_encode = token_data.dict()
         to_encode['sub'] = str(to_encode['sub'])
+        if token_type != 'refresh' or not to_encode.get('jti'):
+            to_encode.pop('jti', None)
         now = datetime.utcnow()
 
 
@@ -195,7 +251,7 @@ class AuthService:
                     detail='User not verified'
                 ) 
             
-            if not AuthService.verify_password(user_data.password, user.password):
+            if not await AuthService.verify_password_async(user_data.password, user.password):
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail='Incorrect password'
@@ -203,6 +259,8 @@ class AuthService:
             
             return user
         
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=500,
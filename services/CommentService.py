@@ -0,0 +1,218 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import exists, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.comments import Comment
+from models.commentslikes import CommentsLikes
+from models.users import Users
+from utils.comments import build_comment_forest
+from utils.pagination import encode_cursor, decode_cursor
+
+
+class CommentService:
+
+    @staticmethod
+    def _comment_columns():
+        """Только поля, нужные для ответа, без ORM-объектов и их связей"""
+        return (
+            Comment.id,
+            Comment.text,
+            Comment.created_at,
+            Comment.like_count,
+            Comment.author_id,
+            Comment.parent_id,
+            Users.nickname.label("author"),
+        )
+
+    @staticmethod
+    def _to_node(row) -> Dict[str, Any]:
+        return {
+            "id": row.id,
+            "text": row.text,
+            "author": row.author,
+            "author_id": row.author_id,
+            "created_at": row.created_at,
+            "like_count": row.like_count or 0,
+            "liked_by_user": False,
+            "reply_count": 0,
+            "replies": [],
+            "has_more_replies": False,
+            "replies_cursor": None,
+        }
+
+    @staticmethod
+    async def _get_page(db: AsyncSession, where, cursor: Optional[str], limit: int):
+        """Страница комментариев, новые сначала, keyset по (created_at, id)"""
+        stmt = (
+            select(*CommentService._comment_columns())
+            .outerjoin(Users, Users.id == Comment.author_id)
+            .where(*where)
+            .order_by(Comment.created_at.desc(), Comment.id.desc())
+            .limit(limit + 1)
+        )
+
+        if cursor:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+            stmt = stmt.where(tuple_(Comment.created_at, Comment.id) < tuple_(cursor_created_at, cursor_id))
+
+        rows = (await db.execute(stmt)).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+        return [CommentService._to_node(row) for row in rows], next_cursor
+
+    @staticmethod
+    async def _attach_replies(db: AsyncSession, nodes: List[Dict[str, Any]], depth: int, replies_limit: int) -> None:
+        """
+        Ответы догружаются по уровням: один запрос на уровень, не больше replies_limit ответов на родителя.
+        Для родителей с неполным списком ответов выставляются has_more_replies и replies_cursor ("показать еще")
+        """
+        level = nodes
+        for _ in range(depth):
+            if not level:
+                return
+
+            parents = {node["id"]: node for node in level}
+            ranked = (
+                select(
+                    *CommentService._comment_columns(),
+                    func.row_number().over(
+                        partition_by=Comment.parent_id,
+                        order_by=(Comment.created_at.desc(), Comment.id.desc())
+                    ).label("rn"),
+                    func.count().over(partition_by=Comment.parent_id).label("total"),
+                )
+                .outerjoin(Users, Users.id == Comment.author_id)
+                .where(Comment.parent_id.in_(parents.keys()))
+                .subquery()
+            )
+            rows = (await db.execute(
+                select(ranked)
+                .where(ranked.c.rn <= replies_limit)
+                .order_by(ranked.c.parent_id, ranked.c.rn)
+            )).all()
+
+            level = []
+            for row in rows:
+                parent = parents[row.parent_id]
+                parent["reply_count"] = row.total
+                reply = CommentService._to_node(row)
+                parent["replies"].append(reply)
+                level.append(reply)
+
+            for parent in parents.values():
+                if parent["reply_count"] > len(parent["replies"]):
+                    parent["has_more_replies"] = True
+                    last = parent["replies"][-1]
+                    parent["replies_cursor"] = encode_cursor(last["created_at"], last["id"])
+
+        # На последнем уровне ответы не грузятся - только их количество (первая страница запрашивается без курсора)
+        if level:
+            by_id = {node["id"]: node for node in level}
+            counts = await db.execute(
+                select(Comment.parent_id, func.count())
+                .where(Comment.parent_id.in_(by_id.keys()))
+                .group_by(Comment.parent_id)
+            )
+            for parent_id, total in counts.all():
+                by_id[parent_id]["reply_count"] = total
+                by_id[parent_id]["has_more_replies"] = True
+
+    @staticmethod
+    async def _mark_liked(db: AsyncSession, nodes: List[Dict[str, Any]], user_id: Optional[int]) -> None:
+        """Лайки текущего пользователя одним запросом по всем комментариям ответа"""
+        if user_id is None:
+            return
+
+        by_id = {}
+        stack = list(nodes)
+        while stack:
+            node = stack.pop()
+            by_id[node["id"]] = node
+            stack.extend(node["replies"])
+
+        if not by_id:
+            return
+
+        result = await db.execute(
+            select(CommentsLikes.comment_id).where(
+                CommentsLikes.user_id == user_id,
+                CommentsLikes.comment_id.in_(by_id.keys())
+            )
+        )
+        for comment_id in result.scalars().all():
+            by_id[comment_id]["liked_by_user"] = True
+
+    @staticmethod
+    async def get_thread(
+        db: AsyncSession,
+        guide_id: int,
+        user_id: Optional[int] = None,
+        cursor: Optional[str] = None,
+        limit: int = 20,
+        depth: int = 1,
+        replies_limit: int = 5
+    ) -> Dict[str, Any]:
+        """Страница корневых комментариев путеводителя с ответами до глубины depth"""
+        comments, next_cursor = await CommentService._get_page(
+            db, (Comment.guide_id == guide_id, Comment.parent_id.is_(None)), cursor, limit
+        )
+        await CommentService._attach_replies(db, comments, depth, replies_limit)
+        await CommentService._mark_liked(db, comments, user_id)
+
+        return {"comments": comments, "next_cursor": next_cursor}
+
+    @staticmethod
+    async def get_liked_comment_ids(db: AsyncSession, guide_id: int, user_id: int) -> Set[int]:
+        """Комментарии путеводителя, лайкнутые пользователем"""
+        result = await db.execute(
+            select(CommentsLikes.comment_id)
+            .join(Comment, Comment.id == CommentsLikes.comment_id)
+            .where(CommentsLikes.user_id == user_id, Comment.guide_id == guide_id)
+        )
+        return set(result.scalars().all())
+
+    @staticmethod
+    async def get_comment_likes(db: AsyncSession, guide_id: int, user_id: int) -> Tuple[Dict[int, int], Set[int]]:
+        """Текущие like_count комментариев путеводителя и лайкнутые пользователем - одним запросом"""
+        liked = exists().where(CommentsLikes.comment_id == Comment.id, CommentsLikes.user_id == user_id)
+        rows = (await db.execute(
+            select(Comment.id, Comment.like_count, liked.label("liked"))
+            .where(Comment.guide_id == guide_id)
+        )).all()
+        return {row.id: row.like_count or 0 for row in rows}, {row.id for row in rows if row.liked}
+
+    @staticmethod
+    async def get_discussion(db: AsyncSession, guide_id: int, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Все обсуждение путеводителя одним плоским запросом (плюс один запрос лайков пользователя)"""
+        rows = (await db.execute(
+            select(*CommentService._comment_columns())
+            .outerjoin(Users, Users.id == Comment.author_id)
+            .where(Comment.guide_id == guide_id)
+            .order_by(Comment.created_at.desc(), Comment.id.desc())
+        )).all()
+
+        liked_ids = set()
+        if user_id is not None and rows:
+            liked_ids = await CommentService.get_liked_comment_ids(db, guide_id, user_id)
+
+        return build_comment_forest(rows, liked_ids)
+
+    @staticmethod
+    async def get_replies(
+        db: AsyncSession,
+        comment_id: int,
+        user_id: Optional[int] = None,
+        cursor: Optional[str] = None,
+        limit: int = 5,
+        depth: int = 1,
+        replies_limit: int = 5
+    ) -> Dict[str, Any]:
+        """Следующая страница ответов на комментарий ("показать еще")"""
+        replies, next_cursor = await CommentService._get_page(db, (Comment.parent_id == comment_id,), cursor, limit)
+        await CommentService._attach_replies(db, replies, depth, replies_limit)
+        await CommentService._mark_liked(db, replies, user_id)
+
+        return {"replies": replies, "next_cursor": next_cursor}
@@ -0,0 +1,162 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+import markdown
+import nh3
+
+from config.appsettings import Settings
+from utils.executor import BoundedExecutor
+from utils.markdown_cache import markdown_cache
+from utils.metrics import metrics
+from utils.uploads import write_bytes_atomic
+
+try:
+    import brotli
+except ImportError:  # brotli опционален: без него отдаются только gzip и identity
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+# Варианты лежат рядом с markdown: {stem}.html, {stem}.html.gz, {stem}.html.br и манифест {stem}.variants.json
+VARIANT_SUFFIXES = {"identity": ".html", "gzip": ".html.gz", "br": ".html.br"}
+MANIFEST_SUFFIX = ".variants.json"
+
+# Порядок предпочтения кодировок при равных q в Accept-Encoding
+ENCODING_PREFERENCE = ("br", "gzip", "identity")
+
+
+@dataclass(frozen=True)
+class ContentVariant:
+    path: Path
+    encoding: str
+    etag: str
+
+
+class GuideContentService:
+    """
+    Готовые представления контента путеводителя: санитизированный HTML и его gzip/brotli-варианты.
+    Рендер и сжатие выполняются один раз при сохранении, чтение отдает готовый файл
+    """
+
+    # Рендер и сжатие - CPU-работа, выполняются вне event loop с ограничением параллелизма
+    _executor = BoundedExecutor("guide_content", Settings.CONTENT_RENDER_WORKERS)
+
+    @staticmethod
+    def render_html(markdown_text: str) -> str:
+        html = markdown.markdown(markdown_text, extensions=["extra", "sane_lists"])
+        return nh3.clean(html)
+
+    @staticmethod
+    def _build(markdown_text: str) -> Dict[str, bytes]:
+        html = GuideContentService.render_html(markdown_text).encode("utf-8")
+
+        # mtime=0 - одинаковый результат для одинакового HTML
+        variants = {"identity": html, "gzip": gzip.compress(html, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants["br"] = brotli.compress(html, quality=Settings.CONTENT_BROTLI_QUALITY)
+        return variants
+
+    @staticmethod
+    def _variant_path(md_path: Path, encoding: str) -> Path:
+        return md_path.with_name(f"{md_path.stem}{VARIANT_SUFFIXES[encoding]}")
+
+    @staticmethod
+    def _manifest_path(md_path: Path) -> Path:
+        return md_path.with_name(f"{md_path.stem}{MANIFEST_SUFFIX}")
+
+    @staticmethod
+    async def build_variants(md_path: Path, markdown_text: str) -> dict:
+        """Рендер HTML и сжатых вариантов рядом с markdown-файлом; манифест пишется последним"""
+        variants = await GuideContentService._executor.run(GuideContentService._build, markdown_text)
+        digest = hashlib.sha256(variants["identity"]).hexdigest()[:32]
+
+        manifest = {"sha256": digest, "variants": {}}
+        for encoding, data in variants.items():
+            path = GuideContentService._variant_path(md_path, encoding)
+            await write_bytes_atomic(path, data, kind="guide_content")
+            manifest["variants"][encoding] = {"file": path.name, "size": len(data)}
+
+        # Варианты от прошлой версии, которые сейчас не собраны (например, без brotli), удаляются
+        for encoding in ENCODING_PREFERENCE:
+            if encoding not in variants:
+                GuideContentService._variant_path(md_path, encoding).unlink(missing_ok=True)
+
+        await write_bytes_atomic(GuideContentService._manifest_path(md_path), json.dumps(manifest).encode("utf-8"), kind="guide_content")
+        metrics.inc("guide_content.rendered")
+        return manifest
+
+    @staticmethod
+    async def get_manifest(md_path: Path) -> dict:
+        """Манифест вариантов; для путеводителей, сохраненных до появления вариантов, собирается при первом чтении"""
+        manifest_path = GuideContentService._manifest_path(md_path)
+        try:
+            # Манифест маленький - читается напрямую, мимо кэша markdown и его метрик
+            return json.loads(await asyncio.to_thread(manifest_path.read_bytes))
+        except FileNotFoundError:
+            logger.info(f"Building content variants for {md_path}")
+            return await GuideContentService.build_variants(md_path, await markdown_cache.read(md_path))
+
+    @staticmethod
+    def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+        accepted = {}
+        for part in (header or "").split(","):
+            coding, _, params = part.strip().partition(";")
+            coding = coding.strip().lower()
+            if not coding:
+                continue
+            q = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    q = float(params[2:])
+                except ValueError:
+                    q = 0.0
+            accepted[coding] = q
+        return accepted
+
+    @staticmethod
+    def choose_encoding(accept_encoding: Optional[str], available) -> str:
+        accepted = GuideContentService.parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get("*")
+
+        # identity без явного q (и без *) - запасной вариант с наименьшим приоритетом:
+        # отдается, только если ни одна другая кодировка не допустима
+        best, best_q = "identity", 0.0
+        for encoding in ENCODING_PREFERENCE:
+            if encoding not in available:
+                continue
+            q = accepted.get(encoding, wildcard if wildcard is not None else 0.0)
+            if q > best_q:
+                best, best_q = encoding, q
+        return best
+
+    @staticmethod
+    async def get_variant(md_path: Path, accept_encoding: Optional[str]) -> ContentVariant:
+        manifest = await GuideContentService.get_manifest(md_path)
+        encoding = GuideContentService.choose_encoding(accept_encoding, manifest["variants"])
+        metrics.inc(f"guide_content.served.{encoding}")
+
+        # Сильный ETag отличается для каждой кодировки (разные байты представления)
+        return ContentVariant(
+            path=md_path.parent / manifest["variants"][encoding]["file"],
+            encoding=encoding,
+            etag=f'"{manifest["sha256"]}-{encoding}"'
+        )
+
+    @staticmethod
+    def remove_variants(md_path: Path) -> None:
+        """Удаление HTML-вариантов и манифеста (markdown удален или заменен)"""
+        paths = [GuideContentService._variant_path(md_path, encoding) for encoding in VARIANT_SUFFIXES]
+        paths.append(GuideContentService._manifest_path(md_path))
+        for path in paths:
+            try:
+                path.unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"Failed to remove content variant {path}: {e}")
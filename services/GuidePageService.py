@@ -0,0 +1,135 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import exists, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+
+from config.appsettings import Settings
+from models.guides import Guides
+from models.guideslikes import GuideLikes
+from services.CommentService import CommentService
+from services.StorageService import storage
+from utils.cache import CacheBackend, TTLCache
+from utils.markdown_cache import markdown_cache
+from utils.metrics import metrics
+
+
+@dataclass(frozen=True)
+class CachedGuidePage:
+    """Общая для всех пользователей часть страницы путеводителя"""
+    data: Dict[str, Any]
+    body: bytes
+    etag: str
+
+
+class GuidePageCache:
+    """
+    Кэш страниц путеводителей: метаданные, markdown, теги и дерево обсуждения без персональных флагов.
+    Ключ включает Guides.page_version: правка путеводителя или новый комментарий в любом воркере
+    поднимает версию, и старые записи становятся недостижимыми. Счетчики лайков здесь могут отставать
+    на TTL, актуальные значения отдает get_overlay
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    def get(self, guide_id: int, version: int) -> Optional[CachedGuidePage]:
+        page = self.backend.get(f"guide:page:{guide_id}:{version}")
+        metrics.inc("guide_page.cache.hits" if page is not None else "guide_page.cache.misses")
+        return page
+
+    def set(self, guide_id: int, version: int, page: CachedGuidePage) -> None:
+        self.backend.set(f"guide:page:{guide_id}:{version}", page)
+
+
+guide_page_cache = GuidePageCache(
+    TTLCache(max_size=Settings.GUIDE_PAGE_CACHE_SIZE, ttl=Settings.GUIDE_PAGE_CACHE_TTL_SECONDS)
+)
+
+
+class GuidePageService:
+
+    @staticmethod
+    async def _load_page(db: AsyncSession, guide_id: int) -> Optional[Dict[str, Any]]:
+        result = await db.execute(
+            select(Guides)
+            .where(Guides.id == guide_id)
+            .options(
+                joinedload(Guides.author),
+                selectinload(Guides.tags)
+            )
+        )
+        guide = result.scalar_one_or_none()
+        if not guide:
+            return None
+
+        markdown_text = await markdown_cache.read(await storage.local_path(guide.content_file_url))
+
+        return {
+            "guide": {
+                "id": guide.id,
+                "title": guide.title,
+                "description": guide.description,
+                "markdown_text": markdown_text,
+                "author": guide.author.nickname,
+                "likes_count": guide.like_count,
+                "tags": [tag.name for tag in guide.tags],
+                "created_at": guide.created_at
+            },
+            "discussion": await CommentService.get_discussion(db, guide.id)
+        }
+
+    @staticmethod
+    async def bump_version(db: AsyncSession, guide_id: int) -> None:
+        """Сброс кэша страницы во всех воркерах; вызывается в транзакции изменения"""
+        await db.execute(
+            update(Guides)
+            .where(Guides.id == guide_id)
+            .values(page_version=Guides.page_version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    async def get_page(db: AsyncSession, guide_id: int) -> Optional[CachedGuidePage]:
+        """Общая часть страницы из кэша или из БД и диска. None, если путеводителя нет"""
+        # Версия - один индексный запрос; удаленный путеводитель не отдается даже из кэша
+        version = await db.scalar(select(Guides.page_version).where(Guides.id == guide_id))
+        if version is None:
+            return None
+
+        page = guide_page_cache.get(guide_id, version)
+        if page is not None:
+            return page
+
+        data = await GuidePageService._load_page(db, guide_id)
+        if data is None:
+            return None
+
+        # Тело сериализуется один раз; ETag - хэш содержимого, одинаковый на всех воркерах
+        body = json.dumps(jsonable_encoder(data), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        page = CachedGuidePage(data=data, body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        guide_page_cache.set(guide_id, version, page)
+        return page
+
+    @staticmethod
+    async def get_overlay(db: AsyncSession, guide_id: int, user_id: int) -> Dict[str, Any]:
+        """
+        Некэшируемая часть страницы: лайки пользователя и текущие счетчики лайков
+        путеводителя и комментариев (в кэшированной странице они могут быть устаревшими)
+        """
+        liked = exists().where(GuideLikes.user_id == user_id, GuideLikes.guide_id == guide_id)
+        guide = (await db.execute(
+            select(Guides.like_count, liked.label("liked")).where(Guides.id == guide_id)
+        )).first()
+        comment_like_counts, liked_comment_ids = await CommentService.get_comment_likes(db, guide_id, user_id)
+
+        return {
+            "liked_by_user": bool(guide and guide.liked),
+            "likes_count": (guide.like_count or 0) if guide else 0,
+            "liked_comment_ids": sorted(liked_comment_ids),
+            "comment_like_counts": comment_like_counts
+        }
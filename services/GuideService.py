@@ -1,13 +1,20 @@
-import os
+import logging
 import re
-import shutil
-from pathlib import Path
 from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import case, select, update
 from models.guides import Guides
-from models.users import Users
-from fastapi import HTTPException
+from models.storedobjects import StoredObjects
+from utils.current_user import CurrentPrincipal
+from fastapi import HTTPException, UploadFile
+from config.appsettings import Settings
+from services.GuideContentService import GuideContentService
+from services.StorageService import PendingObject, StoredObject, storage
+
+logger = logging.getLogger(__name__)
 
 
 
@@ -20,22 +27,119 @@ class GuideService:
         return f"{safe_title}_{timestamp}"
     
     @staticmethod
-    def save_markdown_file(folder_path: Path, markdown_text: str, filename: str = "guide.md") -> Path:
-        md_path = folder_path / filename
-        folder_path.mkdir(parents=True, exist_ok=True)
-        md_path.write_text(markdown_text, encoding="utf-8")
+    async def acquire_file(db: AsyncSession, key: str) -> None:
+        """
+        +1 ссылка на объект в транзакции путеводителя. Строка счетчика остается заблокированной до коммита,
+        поэтому сборщик не удалит объект, пока путеводитель не сохранен
+        """
+        await db.execute(
+            insert(StoredObjects)
+            .values(key=key, ref_count=1)
+            .on_conflict_do_update(
+                index_elements=[StoredObjects.key],
+                set_={"ref_count": StoredObjects.ref_count + 1, "orphaned_at": None}
+            )
+        )
 
-        return md_path
-    
     @staticmethod
-    def save_logo_file(folder_path: Path, logo_file, filename_prefix: str = "logo") -> Path:
-        logo_filename = f"{filename_prefix}_{logo_file.filename}"
-        logo_path = folder_path / logo_filename
-        with open(logo_path, "wb") as out_logo:
-            shutil.copyfileobj(logo_file.file, out_logo)
+    async def release_files(db: AsyncSession, *keys: Optional[str]) -> None:
+        """
+        -1 ссылка на объекты в транзакции путеводителя. Сами объекты удаляет StorageCleanupService,
+        когда ссылок нет дольше STORAGE_GC_GRACE_SECONDS
+        """
+        for key in keys:
+            if not key:
+                continue
+            await db.execute(
+                update(StoredObjects)
+                .where(StoredObjects.key == key)
+                .values(
+                    ref_count=StoredObjects.ref_count - 1,
+                    orphaned_at=case((StoredObjects.ref_count <= 1, datetime.utcnow()), else_=None)
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+    @staticmethod
+    async def register_file(db: AsyncSession, key: str) -> None:
+        """
+        Строка счетчика без ссылок (orphaned_at = сейчас) в отдельной, сразу закоммиченной транзакции -
+        до записи объекта. Если транзакция путеводителя потом откатится, объект останется известен сборщику
+        и будет удален по истечении STORAGE_GC_GRACE_SECONDS
+        """
+        async with AsyncSession(db.bind) as registry:
+            # Обычный SELECT не ждет блокировок: строку может держать текущая транзакция путеводителя
+            if await registry.scalar(select(StoredObjects.key).where(StoredObjects.key == key)) is not None:
+                return
+            await registry.execute(
+                insert(StoredObjects)
+                .values(key=key, ref_count=0, orphaned_at=datetime.utcnow())
+                .on_conflict_do_nothing(index_elements=[StoredObjects.key])
+            )
+            await registry.commit()
+
+    @staticmethod
+    async def _save(db: AsyncSession, pending: PendingObject) -> StoredObject:
+        # Сначала строка для сборщика и ссылка, затем проверка дедупликации и запись
+        try:
+            await GuideService.register_file(db, pending.key)
+            await GuideService.acquire_file(db, pending.key)
+        except BaseException:
+            await storage.discard(pending)
+            raise
+        return await storage.store(pending)
+
+    @staticmethod
+    async def save_markdown(db: AsyncSession, markdown_text: str) -> StoredObject:
+        """markdown в хранилище; возвращает объект с ключом для Guides.content_file_url"""
+        return await GuideService._save(db, storage.stage_bytes(markdown_text.encode("utf-8"), "guides", ".md"))
+
+    @staticmethod
+    async def save_logo(db: AsyncSession, logo_file: UploadFile) -> StoredObject:
+        # Ключ - хэш содержимого: логотип можно кэшировать как неизменяемый
+        pending = await storage.stage_upload(logo_file, "logos", Settings.MAX_GUIDE_LOGO_BYTES, kind="guide_logo")
+        return await GuideService._save(db, pending)
+
+    @staticmethod
+    async def build_content(content_key: str, markdown_text: str) -> None:
+        """HTML-варианты рядом с локальной копией markdown"""
+        await GuideContentService.build_variants(storage.cache_path(content_key), markdown_text)
+
+    @staticmethod
+    async def migrate_to_storage(db: AsyncSession) -> int:
+        """Перенос файлов путеводителей, сохраненных до хранилища (пути content/...), в хранилище"""
+        rows = (await db.execute(select(Guides.id, Guides.content_file_url, Guides.head_image_url))).all()
+
+        migrated = 0
+        for row in rows:
+            keys, markdown_text = {}, None
+            for column, prefix in (("content_file_url", "guides"), ("head_image_url", "logos")):
+                key = getattr(row, column)
+                if not storage.is_legacy(key):
+                    continue
+                try:
+                    data = await storage.get(key)
+                except FileNotFoundError:
+                    logger.warning(f"Guide {row.id}: file {key} not found, skipped")
+                    continue
+
+                keys[column] = (await GuideService._save(db, storage.stage_bytes(data, prefix, Path(key).suffix))).key
+                if column == "content_file_url":
+                    markdown_text = data.decode("utf-8")
+
+            if not keys:
+                continue
+            if markdown_text is not None:
+                await GuideService.build_content(keys["content_file_url"], markdown_text)
+
+            await db.execute(update(Guides).where(Guides.id == row.id).values(**keys))
+            # Старые файлы удалит сборщик
+            await GuideService.release_files(db, *(getattr(row, column) for column in keys))
+            await db.commit()
+            migrated += 1
+
+        return migrated
 
-        return logo_path
-    
     @staticmethod
     def validate_path_within_content_dir(path: Path, base_dir: Path) -> bool:
         try:
@@ -43,9 +147,10 @@ class GuideService:
         except Exception:
             return False
         
-    async def get_guide_by_id(db: AsyncSession, guide_id: int, user: Users = None) -> Guides | None:
+    async def get_guide_by_id(db: AsyncSession, guide_id: int, user: CurrentPrincipal = None, options: tuple = ()) -> Guides | None:
+        # Связи не грузятся жадно - нужные передаются через options (например, selectinload(Guides.tags))
         try:
-            stmt = select(Guides).where(Guides.id == guide_id)
+            stmt = select(Guides).where(Guides.id == guide_id).options(*options)
             if user:
                 stmt = stmt.where(Guides.author_id == user.id)
             result = await db.execute(stmt)
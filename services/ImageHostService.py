@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import random
+import time
+from abc import ABC, abstractmethod
+
+import httpx
+from fastapi import HTTPException, UploadFile, status
+
+from config.appsettings import Settings
+from config.config import uploads_dir
+from utils.metrics import metrics
+from utils.uploads import save_upload
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # без пакета h2 клиент работает по HTTP/1.1 с keep-alive
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+# Задержка загрузки на внешний хостинг, секунды
+UPLOAD_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Допустимые типы изображений и расширения, под которыми они сохраняются
+IMAGE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+}
+
+
+class ImageHostService(ABC):
+    """Интерфейс хостинга изображений для /guide/guide_image"""
+
+    name = "base"
+
+    @abstractmethod
+    async def _upload(self, file: UploadFile) -> str:
+        """Загрузка файла с уже проверенным типом, возвращает публичный URL"""
+
+    async def upload(self, file: UploadFile) -> str:
+        """Загрузка файла, возвращает публичный URL"""
+        # Только изображения: HTML/SVG на нашем домене стали бы хранимым XSS
+        if file.content_type not in IMAGE_EXTENSIONS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Unsupported image type. Only JPEG, PNG, GIF and WebP are allowed."
+            )
+
+        start_time = time.perf_counter()
+        try:
+            url = await self._upload(file)
+        except Exception:
+            metrics.inc(f"image_host.{self.name}.failures")
+            raise
+        metrics.observe(f"image_host.{self.name}.upload_seconds", time.perf_counter() - start_time, UPLOAD_BUCKETS)
+        return url
+
+    async def close(self) -> None:
+        pass
+
+
+class CatboxImageHost(ImageHostService):
+    """
+    Catbox через общий на процесс httpx-клиент: пул соединений с keep-alive (HTTP/2, если есть h2),
+    таймауты и повторы с экспоненциальной задержкой. Файл отправляется потоково из spooled-файла
+    """
+
+    name = "catbox"
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(
+                Settings.IMAGE_HOST_TIMEOUT_SECONDS,
+                connect=Settings.IMAGE_HOST_CONNECT_TIMEOUT_SECONDS
+            ),
+            limits=httpx.Limits(
+                max_connections=Settings.IMAGE_HOST_MAX_CONNECTIONS,
+                max_keepalive_connections=Settings.IMAGE_HOST_MAX_KEEPALIVE
+            )
+        )
+
+    async def _post(self, file: UploadFile) -> httpx.Response:
+        # Повтор отправляет файл заново с начала
+        await file.seek(0)
+        return await self.client.post(
+            Settings.IMAGE_HOST_URL,
+            data={"reqtype": "fileupload", "userhash": Settings.CATBOX_USERHASH},
+            files={"fileToUpload": (file.filename, file.file, file.content_type)}
+        )
+
+    async def _upload(self, file: UploadFile) -> str:
+        attempts = Settings.IMAGE_HOST_RETRIES + 1
+        for attempt in range(1, attempts + 1):
+            start_time = time.perf_counter()
+            try:
+                response = await self._post(file)
+                metrics.observe("image_host.catbox.attempt_seconds", time.perf_counter() - start_time, UPLOAD_BUCKETS)
+
+                if response.status_code == 200:
+                    return response.text.strip()
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt == attempts:
+                    raise HTTPException(
+                        status_code=status.HTTP_502_BAD_GATEWAY,
+                        detail=f"Image host responded with {response.status_code}"
+                    )
+                reason = f"status {response.status_code}"
+            except httpx.TransportError as e:
+                if attempt == attempts:
+                    raise HTTPException(
+                        status_code=status.HTTP_502_BAD_GATEWAY,
+                        detail=f"Image host is unavailable: {e}"
+                    )
+                reason = repr(e)
+
+            # Экспоненциальная задержка с джиттером
+            delay = Settings.IMAGE_HOST_BACKOFF_SECONDS * 2 ** (attempt - 1) * (1 + random.random())
+            metrics.inc("image_host.catbox.retries")
+            logger.warning(f"Catbox upload attempt {attempt} failed ({reason}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class LocalImageHost(ImageHostService):
+    """Локальная замена Catbox для разработки и нагрузочного тестирования без сети"""
+
+    name = "local"
+
+    directory = uploads_dir / "hosted"
+
+    async def _upload(self, file: UploadFile) -> str:
+        # Имя клиента не используется: расширение - по проверенному типу, уникальность дает хэш
+        filename = f"image{IMAGE_EXTENSIONS[file.content_type]}"
+        path = await save_upload(
+            file, self.directory / filename, Settings.IMAGE_HOST_LOCAL_MAX_BYTES,
+            kind="image_host", content_addressed=True
+        )
+        # Отдается через /uploads как неизменяемый файл (хэш в имени)
+        return f"{Settings.IMAGE_HOST_LOCAL_BASE_URL}/uploads/hosted/{path.name}"
+
+
+def create_image_host() -> ImageHostService:
+    if Settings.IMAGE_HOST_BACKEND == "local":
+        return LocalImageHost()
+    return CatboxImageHost()
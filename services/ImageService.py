@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import HTTPException, status
+
+from config.appsettings import Settings
+from services.StorageService import storage
+from utils.cache import TTLCache
+from utils.executor import BoundedExecutor
+from utils.media import IMMUTABLE_CACHE_CONTROL, content_hash
+from utils.metrics import metrics
+from utils.uploads import write_bytes_atomic
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow опционален: без него отдаются только оригиналы
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+
+# Современные форматы в порядке предпочтения, если их поддерживает сборка Pillow
+MODERN_FORMATS = tuple(
+    fmt for fmt in ("avif", "webp")
+    if Image is not None and features.check(fmt)
+)
+
+MEDIA_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+}
+
+
+@dataclass(frozen=True)
+class ImageVariant:
+    path: Path
+    media_type: Optional[str]
+    version: str
+    etag: str
+
+
+class ImageService:
+    """
+    Уменьшенные копии логотипов и аватаров в современных форматах.
+    Варианты создаются лениво при первом запросе и хранятся рядом с оригиналом:
+    {stem}.{size}.{version}.{format}, где version - хэш содержимого оригинала
+    """
+
+    # Декодирование и сжатие изображений - CPU-работа, выполняется вне event loop
+    _executor = BoundedExecutor("images", Settings.IMAGE_WORKERS)
+
+    # Хэши оригиналов по (путь, mtime, размер): файл читается только после изменения
+    _versions = TTLCache(max_size=Settings.IMAGE_VERSION_CACHE_SIZE)
+
+    # Один и тот же вариант не генерируется параллельно несколькими запросами
+    _locks: dict = {}
+
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    async def get_version(path: Path) -> str:
+        """Версия оригинала для content-hash URL"""
+        # У файлов с хэшем содержимого в имени версия известна без чтения файла
+        digest = content_hash(path)
+        if digest:
+            return digest[:16]
+
+        stat = os.stat(path)
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+
+        version = ImageService._versions.get(key)
+        if version is None:
+            version = await ImageService._executor.run(ImageService._hash_file, path)
+            ImageService._versions.set(key, version)
+        return version
+
+    @staticmethod
+    async def versioned_url(
+        base_url: str,
+        path: Optional[Path],
+        size: Optional[str] = None,
+        version: Optional[str] = None
+    ) -> str:
+        """URL с версией содержимого (явной или по файлу path); при отсутствии файла - без версии"""
+        params = [f"size={size}"] if size else []
+        try:
+            version = version or await ImageService.get_version(path)
+            params.append(f"v={version}")
+        except OSError:
+            pass
+        return f"{base_url}?{'&'.join(params)}" if params else base_url
+
+    @staticmethod
+    async def _guide_logo_url(guide, size: Optional[str]) -> str:
+        base_url = f"/guide/get_guide_logo/{guide.id}"
+        # Ключ хранилища содержит sha256 содержимого - версия без обращения к файлу (и к S3)
+        digest = storage.key_digest(guide.head_image_url)
+        if digest:
+            return await ImageService.versioned_url(base_url, None, size, version=digest[:16])
+        # Старые пути (uploads/..., content/...) - хэш локального файла
+        return await ImageService.versioned_url(base_url, storage.cache_path(guide.head_image_url), size)
+
+    @staticmethod
+    async def guide_logo_urls(guides, size: Optional[str] = Settings.LISTING_LOGO_SIZE) -> Dict[int, str]:
+        """Версионированные URL логотипов для карточек (guides - строки/объекты с id и head_image_url)"""
+        urls = await asyncio.gather(*(ImageService._guide_logo_url(guide, size) for guide in guides))
+        return {guide.id: url for guide, url in zip(guides, urls)}
+
+    @staticmethod
+    def validate_size(size: Optional[str]) -> None:
+        if size is not None and size not in Settings.IMAGE_SIZES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown image size. Available: {', '.join(Settings.IMAGE_SIZES)}"
+            )
+
+    @staticmethod
+    def preferred_modern_format(accept: Optional[str]) -> Optional[str]:
+        accept = (accept or "").lower()
+        for fmt in MODERN_FORMATS:
+            if MEDIA_TYPES[fmt] in accept:
+                return fmt
+        return None
+
+    @staticmethod
+    def choose_format(accept: Optional[str], has_alpha: bool) -> str:
+        return ImageService.preferred_modern_format(accept) or ("png" if has_alpha else "jpeg")
+
+    @staticmethod
+    def _render(source: Path, max_side: int, accept: Optional[str]):
+        with Image.open(source) as image:
+            image = ImageOps.exif_transpose(image)
+            has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+            fmt = ImageService.choose_format(accept, has_alpha)
+
+            image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            if fmt == "jpeg":
+                image = image.convert("RGB")
+            elif image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if has_alpha else "RGB")
+
+            buffer = io.BytesIO()
+            save_kwargs = {"optimize": True} if fmt in ("jpeg", "png") else {}
+            if fmt != "png":
+                save_kwargs["quality"] = Settings.IMAGE_QUALITY
+            image.save(buffer, format=fmt.upper(), **save_kwargs)
+            return fmt, buffer.getvalue()
+
+    @staticmethod
+    def _variant_path(source: Path, size: str, version: str, fmt: str) -> Path:
+        return source.with_name(f"{source.stem}.{size}.{version}.{fmt}")
+
+    @staticmethod
+    def _find_variant(source: Path, size: str, version: str, modern_format: Optional[str]) -> Optional[Path]:
+        # Без современного формата выбор png/jpeg зависит от альфа-канала оригинала - создается только один из них
+        for fmt in ([modern_format] if modern_format else ["png", "jpeg"]):
+            path = ImageService._variant_path(source, size, version, fmt)
+            if path.exists():
+                return path
+        return None
+
+    @staticmethod
+    async def get_variant(source: Path, size: Optional[str] = None, accept: Optional[str] = None) -> ImageVariant:
+        """Оригинал (size=None или без Pillow) или уменьшенная копия в лучшем поддерживаемом клиентом формате"""
+        version = await ImageService.get_version(source)
+
+        if size is None or Image is None:
+            return ImageVariant(path=source, media_type=None, version=version, etag=f'"{version}"')
+
+        modern_format = ImageService.preferred_modern_format(accept)
+        path = ImageService._find_variant(source, size, version, modern_format)
+        if path is None:
+            lock_key = (str(source), size, version, modern_format)
+            lock = ImageService._locks.setdefault(lock_key, asyncio.Lock())
+            async with lock:
+                path = ImageService._find_variant(source, size, version, modern_format)
+                if path is None:
+                    fmt, data = await ImageService._executor.run(
+                        ImageService._render, source, Settings.IMAGE_SIZES[size], accept
+                    )
+                    path = ImageService._variant_path(source, size, version, fmt)
+                    await write_bytes_atomic(path, data, kind="image_variant")
+                    metrics.inc(f"images.variants_created.{fmt}")
+            ImageService._locks.pop(lock_key, None)
+
+        fmt = path.suffix.lstrip(".")
+        metrics.inc(f"images.served.{fmt}")
+        return ImageVariant(
+            path=path,
+            media_type=MEDIA_TYPES[fmt],
+            version=version,
+            etag=f'"{version}-{size}-{fmt}"'
+        )
+
+    @staticmethod
+    def cache_headers(variant: ImageVariant, requested_version: Optional[str]) -> dict:
+        """URL с актуальной версией неизменяем и кэшируется надолго, остальное - с ревалидацией по ETag"""
+        headers = {"ETag": variant.etag}
+        if variant.media_type:
+            # Формат уменьшенной копии выбирается по Accept
+            headers["Vary"] = "Accept"
+        if requested_version == variant.version:
+            headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            headers["Cache-Control"] = Settings.MEDIA_CACHE_CONTROL
+        return headers
+
+    @staticmethod
+    def remove_variants(source: Path) -> None:
+        """Удаление всех уменьшенных копий оригинала (при замене или удалении файла)"""
+        for size in Settings.IMAGE_SIZES:
+            for path in source.parent.glob(f"{source.stem}.{size}.*.*"):
+                try:
+                    path.unlink()
+                except OSError as e:
+                    logger.warning(f"Failed to remove image variant {path}: {e}")
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Dict
+
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.orm import sessionmaker
+
+from config.appsettings import Settings
+from models.comments import Comment
+from models.guides import Guides
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LikeCounterBuffer:
+    """
+    Write-behind счетчики лайков: дельты like_count копятся в памяти и сбрасываются пакетами.
+    Таблицы guide_likes/comments_likes остаются источником истины; расхождения чинит
+    команда cli.py reconcile-like-counts (LikeService.reconcile_like_counts)
+    """
+
+    MODELS = (Guides, Comment)
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        flush_interval_ms: int = Settings.LIKE_COUNTER_FLUSH_INTERVAL_MS
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval_ms / 1000
+        self._deltas: Dict[type, Dict[int, int]] = {model: defaultdict(int) for model in self.MODELS}
+        self._flush_lock = asyncio.Lock()
+        self._tasks = []
+
+        metrics.register_gauge(
+            "like_counter.pending",
+            lambda: sum(len(deltas) for deltas in self._deltas.values())
+        )
+
+    def add(self, model, target_id: int, delta: int) -> None:
+        if delta:
+            self._deltas[model][target_id] += delta
+
+    def pending(self, model, target_id: int) -> int:
+        """Еще не сброшенная в БД дельта (для ответа клиенту)"""
+        return self._deltas[model].get(target_id, 0)
+
+    async def flush(self) -> int:
+        """Сброс накопленных дельт одним executemany UPDATE на таблицу"""
+        async with self._flush_lock:
+            # Подменяем словари, новые лайки копятся уже в свежие
+            pending = self._deltas
+            self._deltas = {model: defaultdict(int) for model in self.MODELS}
+
+            start_time = time.perf_counter()
+            flushed = 0
+            try:
+                async with self.session_factory() as db:
+                    # Фиксированный порядок таблиц (MODELS) и строк (по id): параллельные сбросы
+                    # разных воркеров блокируют строки в одном порядке и не взаимоблокируются
+                    for model in self.MODELS:
+                        params = [
+                            {"target_id": target_id, "delta": delta}
+                            for target_id, delta in sorted(pending[model].items()) if delta
+                        ]
+                        if not params:
+                            continue
+
+                        table = model.__table__
+                        await db.execute(
+                            update(table)
+                            .where(table.c.id == bindparam("target_id"))
+                            .values(like_count=func.coalesce(table.c.like_count, 0) + bindparam("delta")),
+                            params
+                        )
+                        flushed += len(params)
+                    await db.commit()
+            except Exception:
+                # Возвращаем дельты обратно, чтобы не потерять их до следующей попытки.
+                # Если ошибка пришла уже после отправки COMMIT (обрыв соединения), исход неизвестен
+                # и дельты могут примениться дважды - такие расхождения чинит reconcile-like-counts,
+                # который в режиме buffered нужно запускать по расписанию
+                for model, deltas in pending.items():
+                    for target_id, delta in deltas.items():
+                        self._deltas[model][target_id] += delta
+                raise
+
+            if flushed:
+                metrics.inc("like_counter.flushed_rows", flushed)
+                metrics.observe("like_counter.flush_seconds", time.perf_counter() - start_time)
+            return flushed
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.inc("like_counter.flush_errors")
+                logger.error(f"Like counter flush failed: {e}")
+
+    def start(self) -> None:
+        self._tasks.append(asyncio.create_task(self._flush_loop(), name="like_counter_flush"))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+        # Финальный сброс, чтобы не потерять дельты при остановке
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Final like counter flush failed: {e}")
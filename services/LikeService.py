@@ -0,0 +1,187 @@
+import asyncio
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from sqlalchemy import Integer, bindparam, delete, exists, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config.appsettings import Settings
+from models.comments import Comment
+from models.commentslikes import CommentsLikes
+from models.guides import Guides
+from models.guideslikes import GuideLikes
+
+if TYPE_CHECKING:
+    from services.LikeCounterBuffer import LikeCounterBuffer
+
+
+class LikeService:
+
+    @staticmethod
+    def _toggle_statement(target_model, like_model, target_fk, target_id: int, user_id: int):
+        """
+        Переключение лайка одним атомарным запросом:
+        WITH removed AS (DELETE лайк RETURNING),
+             inserted AS (INSERT лайк, если ничего не удалили, ON CONFLICT DO NOTHING RETURNING)
+        UPDATE target SET like_count = like_count + |inserted| - |removed| RETURNING like_count
+        """
+        removed = (
+            delete(like_model)
+            .where(like_model.user_id == user_id, target_fk == target_id)
+            .returning(target_fk)
+            .cte("removed")
+        )
+        inserted = (
+            insert(like_model)
+            .from_select(
+                ["user_id", target_fk.key],
+                select(literal(user_id, Integer), literal(target_id, Integer))
+                .where(~exists(select(removed.c[target_fk.key])))
+            )
+            .on_conflict_do_nothing()
+            .returning(target_fk)
+            .cte("inserted")
+        )
+
+        inserted_count = select(func.count()).select_from(inserted).scalar_subquery()
+        removed_count = select(func.count()).select_from(removed).scalar_subquery()
+
+        return (
+            update(target_model)
+            .where(target_model.id == target_id)
+            .values(like_count=func.coalesce(target_model.like_count, 0) + inserted_count - removed_count)
+            .returning(target_model.like_count, inserted_count.label("liked"))
+            .execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    def _toggle_membership_statement(target_model, like_model, target_fk, target_id: int, user_id: int):
+        """
+        Переключение только строки лайка (для буферизованного режима, без UPDATE горячей строки):
+        возвращает число вставленных/удаленных строк и текущий like_count из БД
+        """
+        removed = (
+            delete(like_model)
+            .where(like_model.user_id == user_id, target_fk == target_id)
+            .returning(target_fk)
+            .cte("removed")
+        )
+        inserted = (
+            insert(like_model)
+            .from_select(
+                ["user_id", target_fk.key],
+                select(literal(user_id, Integer), literal(target_id, Integer))
+                .where(~exists(select(removed.c[target_fk.key])))
+            )
+            .on_conflict_do_nothing()
+            .returning(target_fk)
+            .cte("inserted")
+        )
+
+        return select(
+            select(func.count()).select_from(inserted).scalar_subquery().label("liked"),
+            select(func.count()).select_from(removed).scalar_subquery().label("removed"),
+            select(target_model.like_count).where(target_model.id == target_id).scalar_subquery().label("like_count")
+        )
+
+    @staticmethod
+    async def _toggle(
+        db: AsyncSession,
+        target_model,
+        like_model,
+        target_fk,
+        target_id: int,
+        user_id: int,
+        buffer: Optional["LikeCounterBuffer"] = None
+    ) -> Optional[Tuple[bool, int]]:
+        try:
+            if buffer is None:
+                stmt = LikeService._toggle_statement(target_model, like_model, target_fk, target_id, user_id)
+                row = (await db.execute(stmt)).first()
+                if row is None:
+                    return None
+                return bool(row.liked), row.like_count
+
+            stmt = LikeService._toggle_membership_statement(target_model, like_model, target_fk, target_id, user_id)
+            row = (await db.execute(stmt)).first()
+        except IntegrityError:
+            # Нарушение внешнего ключа: объекта не существует
+            await db.rollback()
+            return None
+
+        if row is None:
+            return None
+
+        # Дельта уходит в буфер; в ответе - счетчик из БД плюс еще не сброшенные дельты
+        delta = row.liked - row.removed
+        buffer.add(target_model, target_id, delta)
+        return bool(row.liked), (row.like_count or 0) + buffer.pending(target_model, target_id)
+
+    @staticmethod
+    async def toggle_guide_like(db: AsyncSession, guide_id: int, user_id: int, buffer: Optional["LikeCounterBuffer"] = None) -> Optional[Tuple[bool, int]]:
+        """Лайк/снятие лайка путеводителя. Возвращает (liked, like_count) или None, если путеводителя нет"""
+        return await LikeService._toggle(db, Guides, GuideLikes, GuideLikes.guide_id, guide_id, user_id, buffer)
+
+    @staticmethod
+    async def toggle_comment_like(db: AsyncSession, comment_id: int, user_id: int, buffer: Optional["LikeCounterBuffer"] = None) -> Optional[Tuple[bool, int]]:
+        """Лайк/снятие лайка комментария. Возвращает (liked, like_count) или None, если комментария нет"""
+        return await LikeService._toggle(db, Comment, CommentsLikes, CommentsLikes.comment_id, comment_id, user_id, buffer)
+
+    @staticmethod
+    async def _like_count_drift(db: AsyncSession, target_model, target_fk) -> Dict[int, Tuple[Optional[int], int]]:
+        """Строки с like_count, не совпадающим с таблицей лайков: {id: (like_count, фактическое число)}"""
+        actual_count = select(func.count()).where(target_fk == target_model.id).scalar_subquery()
+        rows = await db.execute(
+            select(target_model.id, target_model.like_count, actual_count.label("actual"))
+            .where(func.coalesce(target_model.like_count, -1) != actual_count)
+        )
+        return {row.id: (row.like_count, row.actual) for row in rows}
+
+    @staticmethod
+    async def reconcile_like_counts(
+        db: AsyncSession,
+        settle_seconds: float = Settings.LIKE_COUNT_RECONCILE_SETTLE_SECONDS
+    ) -> int:
+        """
+        Пересчет like_count по таблицам лайков; возвращает число исправленных строк.
+        Расхождения снимаются дважды с паузой больше периода сброса буферов: чинятся только строки,
+        у которых за паузу не изменились ни like_count, ни число лайков. Строки с несброшенными
+        дельтами (в любом воркере) или свежими лайками пропускаются - их починит следующий запуск
+        """
+        targets = ((Guides, GuideLikes.guide_id), (Comment, CommentsLikes.comment_id))
+
+        first = [await LikeService._like_count_drift(db, model, fk) for model, fk in targets]
+        # Завершаем транзакцию, чтобы второй снимок видел сброшенные за паузу дельты
+        await db.rollback()
+        await asyncio.sleep(settle_seconds)
+
+        repaired = 0
+        for (target_model, target_fk), drift in zip(targets, first):
+            second = await LikeService._like_count_drift(db, target_model, target_fk)
+            params = [
+                {"target_id": target_id, "seen": -1 if seen is None else seen, "actual": actual}
+                for target_id, (seen, actual) in second.items()
+                if drift.get(target_id) == (seen, actual)
+            ]
+            if not params:
+                continue
+
+            # Условие перепроверяется при UPDATE: строку, изменившуюся после снимка, не трогаем
+            table = target_model.__table__
+            actual_count = select(func.count()).where(target_fk == table.c.id).scalar_subquery()
+            stmt = (
+                update(table)
+                .where(
+                    table.c.id == bindparam("target_id"),
+                    func.coalesce(table.c.like_count, -1) == bindparam("seen"),
+                    actual_count == bindparam("actual")
+                )
+                .values(like_count=bindparam("actual"))
+            )
+            # Расхождений единицы; построчно, чтобы rowcount считал только реально исправленные
+            for row_params in params:
+                result = await db.execute(stmt, row_params)
+                repaired += result.rowcount or 0
+        await db.commit()
+        return repaired
@@ -1,29 +1,92 @@
 import time
+import hashlib
+from datetime import datetime
+from dataclasses import dataclass, field, asdict
+from config.appsettings import Settings as AppSettings
 from config.database import get_db
 from models.users import Users
 from models.guides import Guides
 from models.tags import Tags
 from models.guidetags import GuideTags
 from models.guideslikes import GuideLikes
-from sqlalchemy import select, func
+from models.userrecom import UserRecom
+from sqlalchemy import delete, select, func
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from fastapi import Depends, HTTPException, status
-from typing import List, Dict, Set, Optional, Annotated
+from typing import Any, List, Dict, Set, Optional, Annotated
 import chromadb
-from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
 import logging
+import threading
 from collections import Counter, defaultdict
 import re
 from chromadb.config import Settings
-from concurrent.futures import ThreadPoolExecutor
+from utils.cache import CacheBackend, TTLCache
+from utils.executor import BoundedExecutor
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class ReconcileReport:
+    """Итог сверки индекса с таблицей guides"""
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class UserContext:
+    """Данные пользователя, загружаемые один раз на весь конвейер рекомендаций"""
+    user_id: int
+    own_guide_ids: Set[int]
+    liked_ids: Set[int]
+    tag_histogram: Dict[int, int]
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+class RecommendationCache:
+    """
+    Кэш готовых рекомендаций по пользователю.
+    Инвалидация через поколения: смена поколения пользователя (лайк) или глобального
+    (создание/изменение/удаление путеводителя) делает старые ключи недостижимыми
+    """
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    def _generation(self, scope: str) -> int:
+        return self.backend.get(f"recs:gen:{scope}") or 0
+
+    def _key(self, user_id: int, *params) -> str:
+        return ":".join(
+            str(part) for part in
+            ("recs", self._generation("all"), user_id, self._generation(user_id), *params)
+        )
+
+    def get(self, user_id: int, *params) -> Optional[Any]:
+        value = self.backend.get(self._key(user_id, *params))
+        metrics.inc("recommendations.cache.hits" if value is not None else "recommendations.cache.misses")
+        return value
+
+    def set(self, user_id: int, value: Any, *params) -> None:
+        self.backend.set(self._key(user_id, *params), value)
+
+    def invalidate_user(self, user_id: int) -> None:
+        # Поколения без TTL, иначе после истечения они сбросились бы к уже использованным значениям
+        self.backend.set(f"recs:gen:{user_id}", self._generation(user_id) + 1, ttl=0)
+
+    def invalidate_all(self) -> None:
+        self.backend.set("recs:gen:all", self._generation("all") + 1, ttl=0)
+
+
 class RecommendationService:
     """Сервис рекомендаций с улучшенной производительностью и точностью"""
     
@@ -38,10 +101,23 @@ class RecommendationService:
     DESCRIPTION_WEIGHT = 3
     TAGS_WEIGHT = 2
 
-    def __init__(self):
+    def __init__(self, preload_model: bool = False, cache_backend: Optional[CacheBackend] = None):
         try:
-            # Инициализация модели для эмбеддингов
-            self.embedding_model = SentenceTransformer(self.MODEL_NAME)
+            # Модель эмбеддингов одна на процесс и загружается лениво (см. embedding_model)
+            self._embedding_model = None
+            self._model_lock = threading.Lock()
+
+            # Инференс модели и синхронные вызовы Chroma выполняются вне event loop
+            self._executor = BoundedExecutor("recommendations", self.MAX_CONCURRENT_EMBEDDINGS)
+
+            # Кэш готовых рекомендаций (по умолчанию in-process LRU с TTL)
+            self._cache_backend = cache_backend or TTLCache(
+                max_size=AppSettings.RECS_CACHE_SIZE,
+                ttl=AppSettings.RECS_CACHE_TTL_SECONDS
+            )
+            self.cache = RecommendationCache(self._cache_backend)
+            if isinstance(self._cache_backend, TTLCache):
+                metrics.register_gauge("recommendations.cache.size", lambda: len(self._cache_backend))
             
             # Новый клиент ChromaDB
             self.chroma_client = chromadb.PersistentClient(
@@ -49,17 +125,64 @@ class RecommendationService:
                 settings=Settings(allow_reset=True)
             )
             
-            # Коллекция
-            self.collection = self.chroma_client.get_or_create_collection(
-                name=self.COLLECTION_NAME,
-                embedding_function=embedding_functions.SentenceTransformerEmbeddingFunction(
-                    model_name=self.MODEL_NAME
-                )
-            )
+            # Коллекция (персистентная, между перезапусками не пересоздается).
+            # Эмбеддинги считаются сервисом и передаются явно, чтобы Chroma не держала свою копию модели
+            self.collection = self._get_or_create_collection()
+
+            if preload_model:
+                self.load_model()
             
         except Exception as e:
             logger.critical(f"Ошибка инициализации: {e}")
             raise RuntimeError("Не удалось инициализировать сервис рекомендаций")
+
+    @property
+    def embedding_model(self):
+        """Общая модель эмбеддингов, загружается при первом обращении"""
+        if self._embedding_model is None:
+            self.load_model()
+        return self._embedding_model
+
+    def load_model(self) -> None:
+        with self._model_lock:
+            if self._embedding_model is None:
+                # Импорт здесь, чтобы процессы без рекомендаций не тянули torch
+                from sentence_transformers import SentenceTransformer
+
+                start_time = time.time()
+                self._embedding_model = SentenceTransformer(self.MODEL_NAME)
+                logger.info(f"Модель {self.MODEL_NAME} загружена за {time.time()-start_time:.2f}с")
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        return self.embedding_model.encode(texts, convert_to_numpy=True).tolist()
+
+    def _upsert_documents(self, ids: List[str], documents: List[str], metadatas: List[dict]) -> None:
+        self.collection.upsert(
+            ids=ids,
+            documents=documents,
+            embeddings=self._embed(documents),
+            metadatas=metadatas
+        )
+
+    def _recreate_collection(self):
+        try:
+            self.chroma_client.delete_collection(name=self.COLLECTION_NAME)
+        except:
+            pass
+        return self._get_or_create_collection()
+
+    def executor_stats(self) -> dict:
+        return self._executor.stats()
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def _get_or_create_collection(self):
+        return self.chroma_client.get_or_create_collection(
+            name=self.COLLECTION_NAME,
+            metadata={"model": self.MODEL_NAME},
+            embedding_function=None
+        )
     
     @staticmethod
     def preprocess_text(text: str) -> str:
@@ -69,37 +192,16 @@ class RecommendationService:
         return text.lower().strip()
     
     async def index_all_guides(self, db: AsyncSession) -> int:
-        """Полная индексация всех путеводителей"""
+        """Полная переиндексация всех путеводителей (например, после смены модели)"""
         try:
             start_time = time.time()
             
-            # Очистка существующей коллекции
-            try:
-                self.chroma_client.delete_collection(name=self.COLLECTION_NAME)
-            except:
-                pass
-                
-            # Создание новой коллекции
-            self.collection = self.chroma_client.create_collection(
-                name=self.COLLECTION_NAME,
-                embedding_function=embedding_functions.SentenceTransformerEmbeddingFunction(
-                    model_name=self.MODEL_NAME
-                )
-            )
+            # Очистка существующей коллекции и создание новой
+            self.collection = await self._executor.run(self._recreate_collection)
             
-            # Пакетная индексация
-            batch_size = 100
-            offset = 0
             total_indexed = 0
             
-            while True:
-                stmt = select(Guides).options(selectinload(Guides.tags)).offset(offset).limit(batch_size)
-                result = await db.execute(stmt)
-                guides = result.scalars().all()
-                
-                if not guides:
-                    break
-                
+            async for guides in self._iter_guides(db):
                 # Подготовка данных для индексации
                 documents = []
                 metadatas = []
@@ -109,23 +211,17 @@ class RecommendationService:
                     doc = self._create_guide_document(guide)
                     if doc:
                         documents.append(doc)
-                        metadatas.append({
-                            "guide_id": guide.id,
-                            "title": guide.title,
-                            "tags": " ".join([tag.name for tag in guide.tags]) if guide.tags else ""
-                        })
+                        metadatas.append(self._create_guide_metadata(guide, doc))
                         ids.append(str(guide.id))
                 
                 # Добавление в коллекцию
                 if documents:
-                    self.collection.add(
-                        documents=documents,
-                        metadatas=metadatas,
-                        ids=ids
-                    )
+                    await self._executor.run(self._upsert_documents, ids, documents, metadatas)
                     total_indexed += len(documents)
-                
-                offset += batch_size
+
+            # Векторы вкуса построены старыми эмбеддингами и будут пересобраны лениво
+            await db.execute(delete(UserRecom))
+            await db.commit()
             
             logger.info(f"Индексация завершена. Путеводителей: {total_indexed}, время: {time.time()-start_time:.2f}с")
             return total_indexed
@@ -136,22 +232,133 @@ class RecommendationService:
                 status_code=500,
                 detail=f"Ошибка индексации путеводителей: {e}"
             )
+
+    async def reconcile_index(self, db: AsyncSession) -> ReconcileReport:
+        """Сверка индекса с таблицей guides: переиндексируются только новые, измененные и удаленные"""
+        report = ReconcileReport()
+        start_time = time.time()
+
+        indexed_model = (self.collection.metadata or {}).get("model")
+        if indexed_model and indexed_model != self.MODEL_NAME:
+            logger.warning(
+                f"Индекс построен моделью {indexed_model}, текущая модель {self.MODEL_NAME}. "
+                f"Требуется полная переиндексация: python cli.py rebuild-index"
+            )
+
+        # Хэши уже проиндексированных путеводителей
+        indexed_hashes = await self._executor.run(self._get_indexed_hashes)
+        report.timings["load_index"] = time.time() - start_time
+
+        seen_ids = set()
+        embed_time = 0.0
+
+        async for guides in self._iter_guides(db):
+            documents = []
+            metadatas = []
+            ids = []
+
+            for guide in guides:
+                guide_id = str(guide.id)
+
+                # Путеводитель с пустым документом не индексируется: его старый вектор удаляется ниже
+                doc = self._create_guide_document(guide)
+                if not doc:
+                    continue
+                seen_ids.add(guide_id)
+
+                content_hash = self._content_hash(doc)
+                if indexed_hashes.get(guide_id) == content_hash:
+                    report.unchanged += 1
+                    continue
+
+                if guide_id in indexed_hashes:
+                    report.updated += 1
+                else:
+                    report.added += 1
+
+                documents.append(doc)
+                metadatas.append(self._create_guide_metadata(guide, doc))
+                ids.append(guide_id)
+
+            if documents:
+                embed_start = time.time()
+                await self._executor.run(self._upsert_documents, ids, documents, metadatas)
+                embed_time += time.time() - embed_start
+
+        report.timings["embed"] = embed_time
+
+        # Путеводители, удаленные из БД или ставшие пустыми
+        removed_ids = [guide_id for guide_id in indexed_hashes if guide_id not in seen_ids]
+        if removed_ids:
+            delete_start = time.time()
+            await self._executor.run(self.collection.delete, ids=removed_ids)
+            report.timings["delete"] = time.time() - delete_start
+        report.removed = len(removed_ids)
+
+        report.timings["total"] = time.time() - start_time
+        logger.info(f"Сверка индекса завершена: {report.as_dict()}")
+        return report
+
+    def _get_indexed_hashes(self, batch_size: int = 1000) -> Dict[str, Optional[str]]:
+        """Хэши содержимого всех документов коллекции"""
+        hashes = {}
+        offset = 0
+        while True:
+            batch = self.collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            ids = batch.get("ids") or []
+            if not ids:
+                break
+            for guide_id, metadata in zip(ids, batch.get("metadatas") or []):
+                hashes[guide_id] = (metadata or {}).get("content_hash")
+            offset += len(ids)
+        return hashes
+
+    async def _iter_guides(self, db: AsyncSession, batch_size: int = 100):
+        """Пакетная выборка путеводителей с тегами (keyset по id)"""
+        last_id = 0
+        while True:
+            stmt = (
+                select(Guides)
+                .options(selectinload(Guides.tags))
+                .where(Guides.id > last_id)
+                .order_by(Guides.id)
+                .limit(batch_size)
+            )
+            result = await db.execute(stmt)
+            guides = result.scalars().all()
+
+            if not guides:
+                break
+
+            yield guides
+            last_id = guides[-1].id
+
+    def _content_hash(self, document: str) -> str:
+        """Хэш документа с учетом модели, чтобы смена модели инвалидировала индекс"""
+        return hashlib.sha256(f"{self.MODEL_NAME}:{document}".encode("utf-8")).hexdigest()
+
+    def _create_guide_metadata(self, guide: Guides, document: str) -> dict:
+        return {
+            "guide_id": guide.id,
+            "title": guide.title,
+            "tags": " ".join([tag.name for tag in guide.tags]) if guide.tags else "",
+            "content_hash": self._content_hash(document)
+        }
     
     async def index_guide(self, guide: Guides) -> bool:
         """Индексация одного путеводителя"""
         try:
             doc = self._create_guide_document(guide)
             if not doc:
+                # Пустой документ - прежний вектор не должен рекомендоваться
+                await self._executor.run(self.collection.delete, ids=[str(guide.id)])
                 return False
-                
-            self.collection.upsert(
-                ids=[str(guide.id)],
-                documents=[doc],
-                metadatas=[{
-                    "guide_id": guide.id,
-                    "title": guide.title,
-                    "tags": " ".join([tag.name for tag in guide.tags]) if guide.tags else ""
-                }]
+
+            await self._executor.run(
+                self._upsert_documents,
+                [str(guide.id)],
+                [doc],
+                [self._create_guide_metadata(guide, doc)]
             )
             return True
             
@@ -176,67 +383,121 @@ class RecommendationService:
         return " ".join(parts)
     
 
-    async def get_user_recommendations(self, db: AsyncSession, user_id: int, limit: int = 10, exclude_liked: bool = True) -> List[int]:
+    async def get_user_recommendations(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        limit: int = 10,
+        exclude_liked: bool = True,
+        offset: int = 0
+    ) -> List[int]:
+        """
+        Страница рекомендаций пользователя - срез одной закэшированной выдачи.
+        Выдача считается окном, кратным RECS_WINDOW_STEP (не больше RECS_MAX_WINDOW), и пересчитывается,
+        только когда страница выходит за уже посчитанное окно
+        """
+        end = offset + limit
+
+        cached = self.cache.get(user_id, exclude_liked)
+        if cached is not None:
+            window, recommendations = cached
+            # Выдача короче окна - кандидаты кончились, глубже ничего не будет
+            if end <= window or len(recommendations) < window:
+                return recommendations[offset:end]
+
+        step = AppSettings.RECS_WINDOW_STEP
+        window = max(min(-(-end // step) * step, AppSettings.RECS_MAX_WINDOW), end)
+        recommendations = await self._compute_user_recommendations(db, user_id, window, exclude_liked)
+        self.cache.set(user_id, (window, recommendations), exclude_liked)
+
+        return recommendations[offset:end]
+
+    async def _compute_user_recommendations(self, db: AsyncSession, user_id: int, limit: int, exclude_liked: bool) -> List[int]:
+        """Конвейер кандидатов: контент -> теги -> популярные, пока не наберется limit"""
+        exclude_ids = set()
         try:
-            user_guides = await db.execute(
-            select(Guides.id).where(Guides.author_id == user_id))
-            user_guide_ids = {row[0] for row in user_guides.all()}
+            start_time = time.perf_counter()
+            context = await self._load_user_context(db, user_id)
+            context.timings["context"] = time.perf_counter() - start_time
 
-            # Получаем лайкнутые гиды
-            liked_guides = await self._get_liked_guides(db, user_id) if exclude_liked else []
-            liked_ids = {g.id for g in liked_guides}
-            
-            # Объединяем исключаемые ID (лайкнутые + свои)
-            exclude_ids = liked_ids.union(user_guide_ids)
-            
-            # Основные рекомендации
-            content_recs = await self._get_content_recommendations(
-                db, user_id, limit + len(exclude_ids), exclude_ids)
-            content_recs = [id for id in content_recs if id not in exclude_ids][:limit]
-            
-            # Дополняем при необходимости
-            if len(content_recs) < limit:
-                tag_recs = await self._get_tag_recommendations(
-                    db, user_id, limit - len(content_recs), exclude_ids)
-                tag_recs = [id for id in tag_recs if id not in exclude_ids][:limit - len(content_recs)]
-                content_recs.extend(tag_recs)
-            
-            if len(content_recs) < limit:
-                popular_recs = await self._get_popular_guides_excluding(
-                    db, limit - len(content_recs), exclude_ids)
-                content_recs.extend(popular_recs)
-            
-            return content_recs[:limit]
+            # Исключаем свои и (опционально) лайкнутые путеводители
+            exclude_ids = context.own_guide_ids | (context.liked_ids if exclude_liked else set())
+
+            stages = (
+                ("content", self._get_content_recommendations),
+                ("tags", self._get_tag_recommendations),
+                ("popular", self._get_popular_recommendations),
+            )
+
+            recommendations = []
+            for stage_name, stage in stages:
+                remaining = limit - len(recommendations)
+                if remaining <= 0:
+                    break
+
+                stage_start = time.perf_counter()
+                for guide_id in await stage(db, context, remaining, exclude_ids):
+                    if guide_id not in exclude_ids:
+                        recommendations.append(guide_id)
+                        # Кандидаты следующих этапов не должны дублировать уже выбранные
+                        exclude_ids.add(guide_id)
+                context.timings[stage_name] = time.perf_counter() - stage_start
 
+            for stage_name, elapsed in context.timings.items():
+                metrics.observe(f"recommendations.stage.{stage_name}_seconds", elapsed)
+            logger.debug(f"Recommendation timings for user {user_id}: {context.timings}")
+
+            return recommendations[:limit]
 
         except Exception as e:
             logger.error(f"Recommendation error for user {user_id}: {e}")
             return await self._get_popular_guides_excluding(db, limit, exclude_ids)
 
+    async def _load_user_context(self, db: AsyncSession, user_id: int) -> UserContext:
+        """Свои путеводители, лайки и гистограмма тегов лайкнутых - двумя запросами"""
+        result = await db.execute(select(Guides.id).where(Guides.author_id == user_id))
+        own_guide_ids = {row[0] for row in result.all()}
+
+        result = await db.execute(
+            select(GuideLikes.guide_id, GuideTags.tag_id)
+            .outerjoin(GuideTags, GuideTags.guide_id == GuideLikes.guide_id)
+            .where(GuideLikes.user_id == user_id)
+        )
+        liked_ids = set()
+        tag_histogram = Counter()
+        for guide_id, tag_id in result.all():
+            liked_ids.add(guide_id)
+            if tag_id is not None:
+                tag_histogram[tag_id] += 1
+
+        return UserContext(
+            user_id=user_id,
+            own_guide_ids=own_guide_ids,
+            liked_ids=liked_ids,
+            tag_histogram=dict(tag_histogram)
+        )
 
     async def _get_content_recommendations(
         self,
         db: AsyncSession,
-        user_id: int,
+        context: UserContext,
         limit: int,
         exclude_ids: Set[int]
     ) -> List[int]:
-        """Рекомендации на основе контента с исключением указанных ID"""
-        liked_guides = await self._get_liked_guides(db, user_id)
-        if not liked_guides:
+        """Рекомендации на основе контента: поиск ближайших к вектору вкуса пользователя"""
+        if not context.liked_ids:
             return []
-        
-        query_parts = [self._create_guide_document(g) for g in liked_guides]
-        query_text = " ".join([p for p in query_parts if p])
-        
-        if not query_text:
+
+        query_vector = await self._get_user_vector(db, context.user_id)
+        if not query_vector:
             return []
         
         # Фильтрация на стороне ChromaDB
         where = {"guide_id": {"$nin": list(exclude_ids)}} if exclude_ids else None
         
-        results = self.collection.query(
-            query_texts=[query_text],
+        results = await self._executor.run(
+            self.collection.query,
+            query_embeddings=[query_vector],
             n_results=limit * 2,  # Берем с запасом
             where=where
         )
@@ -251,27 +512,117 @@ class RecommendationService:
         
         return recommended_ids
 
+    async def _get_user_vector(self, db: AsyncSession, user_id: int) -> Optional[List[float]]:
+        """Средний вектор вкуса пользователя (без инференса модели)"""
+        profile = await db.get(UserRecom, user_id)
+        if profile is None:
+            return await self.rebuild_user_profile(db, user_id)
+        return profile.vector
+
+    async def rebuild_user_profile(self, db: AsyncSession, user_id: int) -> Optional[List[float]]:
+        """Пересборка вектора вкуса по всем лайкам пользователя из эмбеддингов коллекции"""
+        result = await db.execute(select(GuideLikes.guide_id).where(GuideLikes.user_id == user_id))
+        liked_ids = [row[0] for row in result.all()]
+
+        embeddings = await self._get_guide_embeddings(liked_ids)
+
+        vector_sum = None
+        for embedding in embeddings.values():
+            vector_sum = embedding if vector_sum is None else [a + b for a, b in zip(vector_sum, embedding)]
+        likes_count = len(embeddings)
+
+        stmt = insert(UserRecom).values(
+            user_id=user_id,
+            vector_sum=vector_sum,
+            likes_count=likes_count,
+            updated_at=datetime.utcnow()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserRecom.user_id],
+            set_={
+                "vector_sum": stmt.excluded.vector_sum,
+                "likes_count": stmt.excluded.likes_count,
+                "updated_at": stmt.excluded.updated_at
+            }
+        )
+        await db.execute(stmt)
+        await db.commit()
+
+        if not vector_sum:
+            return None
+        return [value / likes_count for value in vector_sum]
+
+    async def update_user_profile(self, db: AsyncSession, user_id: int, guide_id: int, liked: bool) -> None:
+        """Инкрементальное обновление вектора вкуса при лайке/снятии лайка"""
+        try:
+            profile = await db.get(UserRecom, user_id)
+            if profile is None:
+                await self.rebuild_user_profile(db, user_id)
+                return
+
+            embedding = (await self._get_guide_embeddings([guide_id])).get(guide_id)
+            if embedding is None:
+                return
+
+            sign = 1 if liked else -1
+            likes_count = (profile.likes_count or 0) + sign
+
+            if likes_count <= 0:
+                profile.vector_sum = None
+                profile.likes_count = 0
+            elif not profile.vector_sum:
+                # Рассинхрон (например, снятие лайка без суммы) - проще пересобрать
+                await self.rebuild_user_profile(db, user_id)
+                return
+            else:
+                profile.vector_sum = [a + sign * b for a, b in zip(profile.vector_sum, embedding)]
+                profile.likes_count = likes_count
+
+            await db.commit()
+
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Ошибка обновления вектора вкуса пользователя {user_id}: {e}")
+
+    async def invalidate_guide_likers(self, db: AsyncSession, guide_id: int) -> None:
+        """Сброс векторов вкуса пользователей, лайкнувших путеводитель (при его изменении/удалении)"""
+        await db.execute(
+            delete(UserRecom).where(
+                UserRecom.user_id.in_(select(GuideLikes.user_id).where(GuideLikes.guide_id == guide_id))
+            )
+        )
+
+    async def _get_guide_embeddings(self, guide_ids: List[int]) -> Dict[int, List[float]]:
+        """Эмбеддинги путеводителей, уже сохраненные в коллекции"""
+        if not guide_ids:
+            return {}
+
+        result = await self._executor.run(
+            self.collection.get,
+            ids=[str(guide_id) for guide_id in guide_ids],
+            include=["embeddings"]
+        )
+        embeddings = result.get("embeddings")
+        if embeddings is None:
+            return {}
+
+        return {
+            int(guide_id): [float(value) for value in embedding]
+            for guide_id, embedding in zip(result["ids"], embeddings)
+        }
+
     async def _get_tag_recommendations(
         self,
         db: AsyncSession,
-        user_id: int,
+        context: UserContext,
         limit: int,
         exclude_ids: Set[int]
     ) -> List[int]:
-        """Рекомендации по тегам с исключением указанных ID"""
-        liked_guides = await self._get_liked_guides(db, user_id)
-        if not liked_guides:
-            return []
-            
-        tag_counts = {}
-        for guide in liked_guides:
-            for tag in guide.tags:
-                tag_counts[tag.id] = tag_counts.get(tag.id, 0) + 1
-        
-        if not tag_counts:
+        """Рекомендации по самым частым тегам лайкнутых путеводителей"""
+        if not context.tag_histogram:
             return []
             
-        top_tags = sorted(tag_counts.items(), key=lambda x: x[1], reverse=True)[:3]
+        top_tags = sorted(context.tag_histogram.items(), key=lambda x: x[1], reverse=True)[:3]
         tag_ids = [tag_id for tag_id, _ in top_tags]
         
         stmt = (
@@ -287,6 +638,15 @@ class RecommendationService:
         result = await db.execute(stmt)
         return [row[0] for row in result.all()]
 
+    async def _get_popular_recommendations(
+        self,
+        db: AsyncSession,
+        context: UserContext,
+        limit: int,
+        exclude_ids: Set[int]
+    ) -> List[int]:
+        return await self._get_popular_guides_excluding(db, limit, exclude_ids)
+
     async def _get_popular_guides_excluding(
         self,
         db: AsyncSession,
@@ -303,17 +663,6 @@ class RecommendationService:
         result = await db.execute(stmt)
         return [row[0] for row in result.all()]
     
-    async def _get_liked_guides(self, db: AsyncSession, user_id: int) -> List[Guides]:
-        """Получение лайкнутых путеводителей"""
-        stmt = (
-            select(Guides)
-            .join(GuideLikes)
-            .where(GuideLikes.user_id == user_id)
-            .options(selectinload(Guides.tags))
-        )
-        result = await db.execute(stmt)
-        return result.scalars().all()
-    
     async def _get_popular_guides(self, db: AsyncSession, limit: int) -> List[int]:
         """Получение популярных путеводителей"""
         stmt = select(Guides.id).order_by(Guides.like_count.desc()).limit(limit)
@@ -323,7 +672,7 @@ class RecommendationService:
     async def delete_guide(self, guide_id: int) -> bool:
         """Удаление путеводителя из индекса"""
         try:
-            self.collection.delete(ids=[str(guide_id)])
+            await self._executor.run(self.collection.delete, ids=[str(guide_id)])
             return True
         except Exception as e:
             logger.error(f"Ошибка удаления путеводителя {guide_id}: {e}")
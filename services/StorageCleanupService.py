@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import sessionmaker
+
+from config.appsettings import Settings
+from models.storedobjects import StoredObjects
+from services.GuideContentService import GuideContentService
+from services.ImageService import ImageService
+from services.StorageService import storage
+from utils.markdown_cache import markdown_cache
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class StorageCleanupService:
+    """
+    Фоновое удаление объектов хранилища, на которые дольше паузы не ссылается ни один путеводитель.
+    Строки счетчиков блокируются (FOR UPDATE SKIP LOCKED) до удаления объекта: параллельное сохранение
+    с тем же ключом либо дожидается коммита и записывает объект заново, либо успевает взять ссылку раньше
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        interval_seconds: int = Settings.STORAGE_GC_INTERVAL_SECONDS,
+        grace_seconds: int = Settings.STORAGE_GC_GRACE_SECONDS,
+        batch_size: int = Settings.STORAGE_GC_BATCH_SIZE
+    ):
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.grace = timedelta(seconds=grace_seconds)
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    async def _remove_object(key: str) -> None:
+        path = storage.cache_path(key)
+        await storage.delete(key)
+
+        # Производные файлы на этом узле
+        if path.suffix == ".md":
+            markdown_cache.invalidate(path)
+            GuideContentService.remove_variants(path)
+        else:
+            ImageService.remove_variants(path)
+
+        if storage.is_legacy(key):
+            # Папка путеводителя, сохраненного до хранилища, удаляется, когда в ней ничего не осталось
+            try:
+                path.parent.rmdir()
+            except OSError:
+                pass
+
+    async def purge(self) -> int:
+        """Один проход пакетами, возвращает число удаленных объектов"""
+        start_time = time.perf_counter()
+        cutoff = datetime.utcnow() - self.grace
+        total_purged = 0
+
+        while True:
+            async with self.session_factory() as db:
+                keys = (await db.scalars(
+                    select(StoredObjects.key)
+                    .where(StoredObjects.ref_count <= 0, StoredObjects.orphaned_at < cutoff)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)
+                )).all()
+
+                removed = []
+                for key in keys:
+                    try:
+                        await self._remove_object(key)
+                    except Exception as e:
+                        metrics.inc("storage.gc_errors")
+                        logger.error(f"Failed to delete stored object {key}: {e}")
+                        continue
+                    removed.append(key)
+
+                # Строки удаляются в той же транзакции, что держит их блокировку
+                if removed:
+                    await db.execute(
+                        delete(StoredObjects)
+                        .where(StoredObjects.key.in_(removed))
+                        .execution_options(synchronize_session=False)
+                    )
+                await db.commit()
+
+            total_purged += len(removed)
+            if len(keys) < self.batch_size or not removed:
+                break
+
+        metrics.inc("storage.gc_purged", total_purged)
+        metrics.observe("storage.gc_run_seconds", time.perf_counter() - start_time)
+        logger.info(f"Storage cleanup: purged {total_purged} objects")
+        return total_purged
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.purge()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.inc("storage.gc_errors")
+                logger.error(f"Storage cleanup failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="storage_cleanup")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
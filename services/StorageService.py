@@ -0,0 +1,365 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from fastapi import UploadFile
+
+from config.appsettings import Settings
+from utils.media import IMMUTABLE_CACHE_CONTROL
+from utils.metrics import metrics
+from utils.uploads import StagedFile, commit_staged, discard_staged, stage_stream, stage_upload, write_bytes_atomic
+
+try:
+    import aioboto3
+    from aiobotocore.config import AioConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # aioboto3 нужен только для STORAGE_BACKEND=s3
+    aioboto3 = None
+
+# Пути вида content/... и uploads/... записаны до появления хранилища и лежат на локальном диске
+LEGACY_PREFIXES = ("content", "uploads")
+
+SUFFIX_RE = re.compile(r"\.[A-Za-z0-9]{1,10}")
+SHA256_RE = re.compile(r"[0-9a-f]{64}")
+
+
+@dataclass(frozen=True)
+class PendingObject:
+    """Принятый, но еще не записанный в хранилище объект"""
+    key: str
+    size: int
+    sha256: str
+    staged: Optional[StagedFile] = None
+    data: Optional[bytes] = None
+
+
+@dataclass(frozen=True)
+class StoredObject:
+    key: str
+    size: int
+    sha256: str
+    deduplicated: bool
+
+
+class StorageBackend:
+    """Интерфейс бэкенда объектов: ключ -> неизменяемые байты"""
+
+    name = "base"
+
+    def cache_path(self, key: str) -> Path:
+        """Где объект лежит (или будет лежать) на локальном диске этого узла"""
+        raise NotImplementedError
+
+    @property
+    def staging_dir(self) -> Path:
+        # Временные файлы на той же ФС, что и cache_path - перенос атомарен
+        raise NotImplementedError
+
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    async def put_file(self, key: str, staged: StagedFile) -> None:
+        """Сохранение временного файла под ключом; временный файл забирается бэкендом"""
+        raise NotImplementedError
+
+    async def put_bytes(self, key: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    def stream(self, key: str, chunk_size: int = Settings.UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        raise NotImplementedError
+
+    async def local_path(self, key: str) -> Path:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalStorageBackend(StorageBackend):
+    """Объекты в каталоге STORAGE_LOCAL_ROOT (один узел или общий сетевой диск)"""
+
+    name = "local"
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def cache_path(self, key: str) -> Path:
+        return self.root / key
+
+    @property
+    def staging_dir(self) -> Path:
+        return self.root / ".staging"
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(self.cache_path(key).is_file)
+
+    async def put_file(self, key: str, staged: StagedFile) -> None:
+        await commit_staged(staged, self.cache_path(key))
+
+    async def put_bytes(self, key: str, data: bytes) -> None:
+        await write_bytes_atomic(self.cache_path(key), data, kind="storage")
+
+    async def stream(self, key: str, chunk_size: int = Settings.UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, self.cache_path(key), "rb")
+        try:
+            while chunk := await asyncio.to_thread(f.read, chunk_size):
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+
+    async def local_path(self, key: str) -> Path:
+        path = self.cache_path(key)
+        if not await asyncio.to_thread(path.is_file):
+            raise FileNotFoundError(key)
+        return path
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self.cache_path(key).unlink, missing_ok=True)
+
+
+class S3StorageBackend(StorageBackend):
+    """
+    S3-совместимое хранилище (AWS S3, MinIO). Объекты неизменяемы (ключ - хэш содержимого),
+    поэтому локальная копия в STORAGE_CACHE_DIR никогда не устаревает и служит кэшем для FileResponse
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket: str, cache_dir: Path):
+        if aioboto3 is None:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires the aioboto3 package")
+        self.bucket = bucket
+        self.cache_dir = cache_dir
+        self.session = aioboto3.Session()
+        self._client = None
+        self._client_context = None
+        self._client_lock = asyncio.Lock()
+        # Один объект не скачивается параллельно несколькими запросами
+        self._locks: dict = {}
+
+    async def _get_client(self):
+        # Один клиент (и пул соединений) на процесс, создается при первом обращении
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    context = self.session.client(
+                        "s3",
+                        endpoint_url=Settings.STORAGE_S3_ENDPOINT_URL or None,
+                        region_name=Settings.STORAGE_S3_REGION,
+                        aws_access_key_id=Settings.STORAGE_S3_ACCESS_KEY or None,
+                        aws_secret_access_key=Settings.STORAGE_S3_SECRET_KEY or None,
+                        config=AioConfig(max_pool_connections=Settings.STORAGE_S3_MAX_CONNECTIONS)
+                    )
+                    self._client = await context.__aenter__()
+                    self._client_context = context
+        return self._client
+
+    @staticmethod
+    def _is_missing(error: "ClientError") -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def cache_path(self, key: str) -> Path:
+        return self.cache_dir / key
+
+    @property
+    def staging_dir(self) -> Path:
+        return self.cache_dir / ".staging"
+
+    async def exists(self, key: str) -> bool:
+        client = await self._get_client()
+        try:
+            await client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if self._is_missing(e):
+                return False
+            raise
+        return True
+
+    @staticmethod
+    def _extra_args(key: str) -> dict:
+        content_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+        return {"ContentType": content_type, "CacheControl": IMMUTABLE_CACHE_CONTROL}
+
+    async def put_file(self, key: str, staged: StagedFile) -> None:
+        client = await self._get_client()
+        try:
+            # Управляемая загрузка: большие файлы уходят multipart-частями с диска
+            await client.upload_file(str(staged.path), self.bucket, key, ExtraArgs=self._extra_args(key))
+        except BaseException:
+            await discard_staged(staged)
+            raise
+        # Загруженный файл сразу становится локальной копией
+        await commit_staged(staged, self.cache_path(key))
+
+    async def put_bytes(self, key: str, data: bytes) -> None:
+        client = await self._get_client()
+        await client.put_object(Bucket=self.bucket, Key=key, Body=data, **self._extra_args(key))
+        await write_bytes_atomic(self.cache_path(key), data, kind="storage_cache")
+
+    async def stream(self, key: str, chunk_size: int = Settings.UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        client = await self._get_client()
+        try:
+            response = await client.get_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(key) from e
+            raise
+        async with response["Body"] as body:
+            while chunk := await body.read(chunk_size):
+                yield chunk
+
+    async def local_path(self, key: str) -> Path:
+        path = self.cache_path(key)
+        if await asyncio.to_thread(path.is_file):
+            metrics.inc("storage.s3.cache_hits")
+            return path
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                if not await asyncio.to_thread(path.is_file):
+                    metrics.inc("storage.s3.cache_misses")
+                    staged = await stage_stream(self.stream(key), self.staging_dir, kind="storage_download")
+                    await commit_staged(staged, path)
+        finally:
+            self._locks.pop(key, None)
+        return path
+
+    async def delete(self, key: str) -> None:
+        client = await self._get_client()
+        await client.delete_object(Bucket=self.bucket, Key=key)
+        await asyncio.to_thread(self.cache_path(key).unlink, missing_ok=True)
+
+    async def close(self) -> None:
+        if self._client_context is not None:
+            await self._client_context.__aexit__(None, None, None)
+            self._client = None
+            self._client_context = None
+
+
+class StorageService:
+    """
+    Хранилище контента путеводителей. Ключ объекта - хэш содержимого ({prefix}/{ab}/{sha256}{ext}),
+    поэтому одинаковые загрузки хранятся один раз, а объекты никогда не меняются на месте.
+    Значения в БД - ключи, а не пути конкретного узла; старые пути content/... читаются с диска как раньше
+    """
+
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+
+    @staticmethod
+    def object_key(prefix: str, digest: str, suffix: str) -> str:
+        # Расширение нужно для Content-Type; все остальное из имени клиента отбрасывается
+        suffix = suffix.lower() if SUFFIX_RE.fullmatch(suffix) else ""
+        return f"{prefix}/{digest[:2]}/{digest}{suffix}"
+
+    @staticmethod
+    def key_digest(key: str) -> Optional[str]:
+        """sha256 содержимого из ключа {prefix}/{xx}/{sha256}{suffix}; None для старых путей и чужих ключей"""
+        parts = Path(key).parts
+        if len(parts) != 3 or parts[0] in LEGACY_PREFIXES:
+            return None
+        digest = parts[2].split(".", 1)[0]
+        return digest if SHA256_RE.fullmatch(digest) and parts[1] == digest[:2] else None
+
+    @staticmethod
+    def is_legacy(key: str) -> bool:
+        return Path(key).parts[0] in LEGACY_PREFIXES
+
+    @staticmethod
+    def _validate_key(key: str) -> None:
+        if Path(key).is_absolute() or ".." in Path(key).parts:
+            raise ValueError(f"Invalid storage key: {key}")
+
+    async def stage_upload(self, upload: UploadFile, prefix: str, max_bytes: int, kind: str = "file") -> PendingObject:
+        """Потоковый прием UploadFile (с лимитом размера) во временный файл; ключ - хэш содержимого"""
+        staged = await stage_upload(upload, self.backend.staging_dir, max_bytes, kind)
+        key = self.object_key(prefix, staged.sha256, Path(upload.filename or "").suffix)
+        return PendingObject(key=key, size=staged.size, sha256=staged.sha256, staged=staged)
+
+    def stage_bytes(self, data: bytes, prefix: str, suffix: str) -> PendingObject:
+        digest = hashlib.sha256(data).hexdigest()
+        return PendingObject(key=self.object_key(prefix, digest, suffix), size=len(data), sha256=digest, data=data)
+
+    async def discard(self, pending: PendingObject) -> None:
+        if pending.staged is not None:
+            await discard_staged(pending.staged)
+
+    async def store(self, pending: PendingObject) -> StoredObject:
+        """
+        Запись подготовленного объекта, если его еще нет (дедупликация).
+        Ссылка на ключ к этому моменту уже должна быть взята в транзакции (GuideService.acquire_file):
+        тогда сборщик не удалит объект между проверкой и коммитом
+        """
+        try:
+            if await self.backend.exists(pending.key):
+                await self.discard(pending)
+                metrics.inc("storage.dedup_hits")
+                metrics.inc("storage.dedup_bytes", pending.size)
+                return StoredObject(key=pending.key, size=pending.size, sha256=pending.sha256, deduplicated=True)
+
+            if pending.staged is not None:
+                await self.backend.put_file(pending.key, pending.staged)
+            else:
+                await self.backend.put_bytes(pending.key, pending.data)
+        except BaseException:
+            await self.discard(pending)
+            raise
+
+        metrics.inc(f"storage.{self.backend.name}.puts")
+        metrics.inc(f"storage.{self.backend.name}.bytes", pending.size)
+        return StoredObject(key=pending.key, size=pending.size, sha256=pending.sha256, deduplicated=False)
+
+    def cache_path(self, key: str) -> Path:
+        if self.is_legacy(key):
+            return Path(key)
+        self._validate_key(key)
+        return self.backend.cache_path(key)
+
+    async def local_path(self, key: str) -> Path:
+        """Локальный файл объекта (для S3 - скачивается в кэш при первом обращении). FileNotFoundError, если объекта нет"""
+        if self.is_legacy(key):
+            if not await asyncio.to_thread(os.path.isfile, key):
+                raise FileNotFoundError(key)
+            return Path(key)
+        self._validate_key(key)
+        return await self.backend.local_path(key)
+
+    async def get(self, key: str) -> bytes:
+        path = await self.local_path(key)
+        return await asyncio.to_thread(path.read_bytes)
+
+    def stream(self, key: str, chunk_size: int = Settings.UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        if self.is_legacy(key):
+            return LocalStorageBackend(Path(".")).stream(key, chunk_size)
+        self._validate_key(key)
+        return self.backend.stream(key, chunk_size)
+
+    async def delete(self, key: str) -> None:
+        """Удаление объекта. Вызывается только сборщиком (StorageCleanupService) под блокировкой строки счетчика"""
+        if self.is_legacy(key):
+            await asyncio.to_thread(Path(key).unlink, missing_ok=True)
+            return
+        self._validate_key(key)
+        await self.backend.delete(key)
+        metrics.inc(f"storage.{self.backend.name}.deletes")
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+def create_storage_backend() -> StorageBackend:
+    if Settings.STORAGE_BACKEND == "s3":
+        return S3StorageBackend(Settings.STORAGE_S3_BUCKET, Path(Settings.STORAGE_CACHE_DIR))
+    return LocalStorageBackend(Path(Settings.STORAGE_LOCAL_ROOT))
+
+
+storage = StorageService(create_storage_backend())
@@ -0,0 +1,128 @@
+import re
+import unicodedata
+from typing import Dict, Iterable, List
+
+from sqlalchemy import Integer, delete, exists, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config.appsettings import Settings
+from models.guidetags import GuideTags
+from models.tags import Tags
+from utils.cache import TTLCache
+from utils.metrics import metrics
+
+
+# Имя тега -> id. Теги не переименовываются; запись сбрасывается, когда тег удаляется как осиротевший
+tag_id_cache = TTLCache(max_size=Settings.TAG_CACHE_SIZE, ttl=Settings.TAG_CACHE_TTL_SECONDS)
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+class TagService:
+
+    @staticmethod
+    def normalize_names(names: Iterable[str]) -> List[str]:
+        """NFC, обрезка и схлопывание пробелов, без пустых и повторов (порядок сохраняется)"""
+        normalized = {}
+        for name in names:
+            name = WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", name)).strip()
+            if name:
+                normalized.setdefault(name, None)
+        return list(normalized)
+
+    @staticmethod
+    async def _upsert(db: AsyncSession, names: List[str]) -> Dict[str, int]:
+        """
+        Создание недостающих тегов одним INSERT ... ON CONFLICT DO NOTHING RETURNING,
+        id уже существующих (в том числе созданных параллельно) - одним SELECT ... WHERE name IN.
+        Имена вставляются в отсортированном порядке, чтобы параллельные вставки брали блокировки
+        уникального индекса в одном порядке и не взаимоблокировались
+        """
+        created = await db.execute(
+            insert(Tags)
+            .values([{"name": name} for name in sorted(names)])
+            .on_conflict_do_nothing(index_elements=[Tags.name])
+            .returning(Tags.name, Tags.id)
+        )
+        tag_ids = dict(created.tuples().all())
+        metrics.inc("tags.created", len(tag_ids))
+
+        existing = [name for name in names if name not in tag_ids]
+        if existing:
+            found = await db.execute(select(Tags.name, Tags.id).where(Tags.name.in_(existing)))
+            tag_ids.update(found.tuples().all())
+
+        for name, tag_id in tag_ids.items():
+            tag_id_cache.set(name, tag_id)
+        return tag_ids
+
+    @staticmethod
+    async def resolve_ids(db: AsyncSession, names: List[str]) -> Dict[str, int]:
+        """id тегов по нормализованным именам; отсутствующие создаются"""
+        tag_ids = {}
+        missing = []
+        for name in names:
+            tag_id = tag_id_cache.get(name)
+            if tag_id is None:
+                missing.append(name)
+            else:
+                tag_ids[name] = tag_id
+
+        metrics.inc("tags.cache.hits", len(tag_ids))
+        metrics.inc("tags.cache.misses", len(missing))
+        if missing:
+            tag_ids.update(await TagService._upsert(db, missing))
+        return tag_ids
+
+    @staticmethod
+    async def _link(db: AsyncSession, guide_id: int, tag_ids: Iterable[int]) -> set:
+        # Связываются только существующие теги: id из кэша мог устареть, если другой воркер удалил тег
+        linked = await db.scalars(
+            insert(GuideTags)
+            .from_select(
+                ["guide_id", "tag_id"],
+                select(literal(guide_id, Integer), Tags.id).where(Tags.id.in_(set(tag_ids)))
+            )
+            .on_conflict_do_nothing()
+            .returning(GuideTags.tag_id)
+        )
+        return set(linked.all())
+
+    @staticmethod
+    async def set_guide_tags(db: AsyncSession, guide_id: int, names: Iterable[str]) -> Dict[str, int]:
+        """
+        Теги нового путеводителя: нормализация, пакетное создание недостающих и вставка всех связей
+        одним запросом. Возвращает {имя: id} в порядке ввода
+        """
+        names = TagService.normalize_names(names)
+        if not names:
+            return {}
+
+        tag_ids = await TagService.resolve_ids(db, names)
+        linked = await TagService._link(db, guide_id, tag_ids.values())
+
+        stale = [name for name, tag_id in tag_ids.items() if tag_id not in linked]
+        if stale:
+            metrics.inc("tags.cache.stale", len(stale))
+            for name in stale:
+                tag_id_cache.delete(name)
+            fresh = await TagService._upsert(db, stale)
+            await TagService._link(db, guide_id, fresh.values())
+            tag_ids.update(fresh)
+
+        return {name: tag_ids[name] for name in names}
+
+    @staticmethod
+    async def delete_orphans(db: AsyncSession) -> List[str]:
+        """Удаление тегов без путеводителей; их записи в кэше сбрасываются"""
+        deleted = await db.scalars(
+            delete(Tags)
+            .where(~exists().where(GuideTags.tag_id == Tags.id))
+            .returning(Tags.name)
+            .execution_options(synchronize_session=False)
+        )
+        names = deleted.all()
+        for name in names:
+            tag_id_cache.delete(name)
+        return names
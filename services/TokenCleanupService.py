@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, delete, or_, select
+from sqlalchemy.orm import sessionmaker
+
+from config.appsettings import Settings
+from models.refreshtokens import RefreshTokens
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCleanupService:
+    """Фоновое удаление истекших и отозванных refresh-токенов пакетами"""
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        interval_seconds: int = Settings.REFRESH_TOKEN_CLEANUP_INTERVAL_SECONDS,
+        retention_days: int = Settings.REFRESH_TOKEN_RETENTION_DAYS,
+        batch_size: int = Settings.REFRESH_TOKEN_CLEANUP_BATCH_SIZE
+    ):
+        self.session_factory = session_factory
+        self.interval_seconds = interval_seconds
+        self.retention = timedelta(days=retention_days)
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def purge(self) -> int:
+        """Один проход: удаляет пакетами все записи старше срока хранения, возвращает число удаленных"""
+        start_time = time.perf_counter()
+        cutoff = datetime.utcnow() - self.retention
+        total_purged = 0
+
+        while True:
+            # Отдельная транзакция на пакет, чтобы не держать долгие блокировки
+            async with self.session_factory() as db:
+                batch_ids = (
+                    select(RefreshTokens.id)
+                    .where(or_(
+                        RefreshTokens.expires_at < cutoff,
+                        and_(RefreshTokens.is_revoked == True, RefreshTokens.revoked_at < cutoff)
+                    ))
+                    .limit(self.batch_size)
+                    .scalar_subquery()
+                )
+                result = await db.execute(
+                    delete(RefreshTokens)
+                    .where(RefreshTokens.id.in_(batch_ids))
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+
+            purged = result.rowcount or 0
+            total_purged += purged
+            if purged < self.batch_size:
+                break
+
+        metrics.inc("refresh_tokens.purged", total_purged)
+        metrics.observe("refresh_tokens.purge_run_seconds", time.perf_counter() - start_time)
+        logger.info(f"Refresh tokens cleanup: purged {total_purged} rows")
+        return total_purged
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.purge()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                metrics.inc("refresh_tokens.purge_errors")
+                logger.error(f"Refresh tokens cleanup failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="refresh_tokens_cleanup")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
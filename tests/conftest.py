@@ -0,0 +1,109 @@
+import uuid
+
+import httpx
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete, text
+
+from main import app
+from config.database import AsyncSessionLocal, engine
+from config.migrations import run_migrations
+from models.basemodel import BaseModel
+from models.comments import Comment
+from models.guides import Guides
+from models.users import Users
+from schemas.auth import TokenData
+from services.AuthService import AuthService
+from services.GuideService import GuideService
+from utils.query_counter import DEFAULT_QUERY_BUDGETS, count_queries, install_query_counter
+
+
+install_query_counter(engine)
+
+
+@pytest_asyncio.fixture
+async def db():
+    """Сессия тестовой БД (настройки DB_* из окружения); без PostgreSQL тест пропускается"""
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception as e:
+        await engine.dispose()
+        pytest.skip(f"PostgreSQL is unavailable: {e}")
+
+    # Схема как при старте приложения (lifespan через ASGITransport не запускается)
+    async with engine.begin() as conn:
+        await conn.run_sync(BaseModel.metadata.create_all)
+        await run_migrations(conn)
+
+    async with AsyncSessionLocal() as session:
+        yield session
+    # Соединения пула привязаны к циклу событий теста
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def client():
+    # ASGITransport вызывает приложение в той же задаче: счетчик запросов из контекста теста виден роутам
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+@pytest_asyncio.fixture
+async def guide(db):
+    """Пользователь и путеводитель с одним комментарием; удаляются после теста"""
+    suffix = uuid.uuid4().hex[:12]
+    user = Users(nickname=f"budget_{suffix}", email=f"budget_{suffix}@example.com", password="-", is_verified=True)
+    db.add(user)
+    await db.flush()
+
+    content = await GuideService.save_markdown(db, "# Budget\n\nQuery budget test guide")
+    guide = Guides(
+        title=f"Budget {suffix}",
+        description="Query budget test guide",
+        content_file_url=content.key,
+        head_image_url="logos/default.png",
+        author_id=user.id
+    )
+    db.add(guide)
+    await db.flush()
+    db.add(Comment(text="Budget comment", author_id=user.id, guide_id=guide.id))
+    await db.commit()
+
+    yield guide, user
+
+    await db.execute(delete(Comment).where(Comment.guide_id == guide.id))
+    await db.execute(delete(Guides).where(Guides.id == guide.id))
+    await GuideService.release_files(db, content.key)
+    await db.execute(delete(Users).where(Users.id == user.id))
+    await db.commit()
+
+
+@pytest.fixture
+def auth_headers():
+    def build(user: Users) -> dict:
+        token = AuthService.create_jwt_token(
+            TokenData(sub=str(user.id), nickname=user.nickname, email=user.email),
+            "access"
+        )
+        return {"Authorization": f"Bearer {token}"}
+    return build
+
+
+@pytest.fixture
+def query_budget(client):
+    """
+    Запрос к приложению с проверкой бюджета из DEFAULT_QUERY_BUDGETS по шаблону пути роута.
+    При превышении тест падает со списком выполненных SQL-запросов
+    """
+    async def request(method: str, route_path: str, url: str, **kwargs) -> httpx.Response:
+        budget = DEFAULT_QUERY_BUDGETS[route_path]
+        with count_queries() as counter:
+            response = await client.request(method, url, **kwargs)
+
+        statements = "\n".join(counter.statements)
+        assert counter.count <= budget, (
+            f"{method} {route_path}: {counter.count} queries, budget {budget}\n{statements}"
+        )
+        return response
+    return request
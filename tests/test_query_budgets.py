@@ -0,0 +1,60 @@
+import pytest
+
+from main import app
+from utils.query_counter import DEFAULT_QUERY_BUDGETS
+
+
+def test_budgets_match_routes():
+    # Ключи таблицы - шаблоны путей роутов; опечатка молча отключила бы проверку
+    assert set(DEFAULT_QUERY_BUDGETS) <= set(app.openapi()["paths"])
+
+
+@pytest.mark.asyncio
+async def test_catalog(query_budget, guide):
+    response = await query_budget("GET", "/catalog", "/catalog")
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_popular(query_budget, guide):
+    response = await query_budget("GET", "/popular", "/popular")
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_tags(query_budget, db):
+    response = await query_budget("GET", "/guide/tags", "/guide/tags")
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_guide_body(query_budget, guide):
+    guide, _ = guide
+    response = await query_budget("GET", "/guide/body/{guide_id}", f"/guide/body/{guide.id}")
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_read_guide(query_budget, guide, auth_headers):
+    guide, user = guide
+    response = await query_budget(
+        "GET", "/guide/read_guide/{guide_id}", f"/guide/read_guide/{guide.id}", headers=auth_headers(user)
+    )
+    assert response.status_code == 200
+    assert len(response.json()["discussion"]) >= 1
+
+
+@pytest.mark.asyncio
+async def test_guide_overlay(query_budget, guide, auth_headers):
+    guide, user = guide
+    response = await query_budget(
+        "GET", "/guide/overlay/{guide_id}", f"/guide/overlay/{guide.id}", headers=auth_headers(user)
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_comments(query_budget, guide):
+    guide, _ = guide
+    response = await query_budget("GET", "/comments/{guide_id}", f"/comments/{guide.id}")
+    assert response.status_code == 200
@@ -0,0 +1,28 @@
+import uuid
+
+import pytest
+from sqlalchemy import select
+
+from config.database import AsyncSessionLocal
+from models.storedobjects import StoredObjects
+from services.GuideService import GuideService
+from services.StorageCleanupService import StorageCleanupService
+from services.StorageService import storage
+
+
+@pytest.mark.asyncio
+async def test_rolled_back_save_is_collectable(db):
+    stored = await GuideService.save_markdown(db, f"# Rollback {uuid.uuid4().hex}")
+    assert await storage.backend.exists(stored.key)
+
+    # Транзакция путеводителя не дошла до коммита
+    await db.rollback()
+
+    row = (await db.execute(select(StoredObjects).where(StoredObjects.key == stored.key))).scalar_one()
+    assert row.ref_count == 0
+    assert row.orphaned_at is not None
+
+    await StorageCleanupService(AsyncSessionLocal, grace_seconds=0).purge()
+
+    assert not await storage.backend.exists(stored.key)
+    assert await db.scalar(select(StoredObjects.key).where(StoredObjects.key == stored.key)) is None
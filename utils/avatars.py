@@ -0,0 +1,45 @@
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config.appsettings import Settings
+from config.config import uploads_dir
+from models.users import Users
+from utils.cache import TTLCache
+from utils.metrics import metrics
+
+
+# Имя файла аватара по нику ("nick:...") и по id ("id:...")
+avatar_path_cache = TTLCache(max_size=Settings.AVATAR_PATH_CACHE_SIZE, ttl=Settings.AVATAR_PATH_CACHE_TTL_SECONDS)
+
+
+def invalidate_avatar_path(user_id: int, *nicknames: Optional[str]) -> None:
+    avatar_path_cache.delete(f"id:{user_id}")
+    for nickname in nicknames:
+        if nickname:
+            avatar_path_cache.delete(f"nick:{nickname}")
+
+
+async def get_avatar_path(db: AsyncSession, nickname: Optional[str] = None, user_id: Optional[int] = None) -> Optional[Path]:
+    """Путь к файлу аватара без запроса в БД при попадании в кэш. None, если пользователя нет"""
+    key = f"nick:{nickname}" if nickname is not None else f"id:{user_id}"
+
+    avatar_url = avatar_path_cache.get(key)
+    if avatar_url is not None:
+        path = uploads_dir / avatar_url
+        # Аватар мог смениться на другом воркере - старого файла уже нет
+        if path.exists():
+            metrics.inc("avatar_paths.cache.hits")
+            return path
+        avatar_path_cache.delete(key)
+
+    metrics.inc("avatar_paths.cache.misses")
+    condition = Users.nickname == nickname if nickname is not None else Users.id == user_id
+    avatar_url = (await db.execute(select(Users.avatar_url).where(condition))).scalars().first()
+    if avatar_url is None:
+        return None
+
+    avatar_path_cache.set(key, avatar_url)
+    return uploads_dir / avatar_url
@@ -1,28 +1,64 @@
-from typing import Optional, Dict, Any
-from models.comments import Comment
-from models.users import Users
-from datetime import datetime
-
-def build_comment_tree(
-    comment: Comment,
-    current_user_id: Optional[int] = None
-) -> Dict[str, Any]:
-    """Рекурсивно строит дерево комментариев с информацией о лайках"""
-    return {
-        "id": comment.id,
-        "text": comment.text,
-        "author": comment.author.nickname,
-        "author_id": comment.author.id,
-        "created_at": comment.created_at,
-        "like_count": comment.like_count,
-        "liked_by_user": current_user_id is not None 
-                         and any(u.id == current_user_id for u in comment.liked_by),
-        "replies": [
-            build_comment_tree(reply, current_user_id) 
-            for reply in sorted(
-                comment.replies,
-                key=lambda x: x.created_at,
-                reverse=True
-            )
-        ]
-    }
\ No newline at end of file
+from typing import Optional, Dict, Any, Iterable, List, Set
+
+
+def build_comment_forest(
+    rows: Iterable[Any],
+    liked_ids: Optional[Set[int]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Строит дерево комментариев из плоской выборки за линейное время, без рекурсии.
+    rows должны быть отсортированы по (created_at, id) по убыванию - тогда ответы
+    каждого уровня сразу идут в нужном порядке (новые сначала)
+    """
+    liked_ids = liked_ids or set()
+    nodes: Dict[int, Dict[str, Any]] = {}
+    ordered = []
+
+    for row in rows:
+        node = {
+            "id": row.id,
+            "text": row.text,
+            "author": row.author,
+            "author_id": row.author_id,
+            "created_at": row.created_at,
+            "like_count": row.like_count,
+            "liked_by_user": row.id in liked_ids,
+            "replies": []
+        }
+        nodes[row.id] = node
+        ordered.append((row.parent_id, node))
+
+    roots = []
+    for parent_id, node in ordered:
+        if parent_id is None:
+            roots.append(node)
+        elif parent_id in nodes:
+            nodes[parent_id]["replies"].append(node)
+
+    return roots
+
+
+def apply_comment_likes(
+    tree: List[Dict[str, Any]],
+    liked_ids: Set[int],
+    like_counts: Optional[Dict[int, int]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Копия дерева с персональными флагами liked_by_user и свежими like_count
+    (общее дерево из кэша не изменяется). Обход с явным стеком, без рекурсии
+    """
+    like_counts = like_counts or {}
+    result: List[Dict[str, Any]] = []
+    stack = [(node, result) for node in reversed(tree)]
+    while stack:
+        node, target = stack.pop()
+        copy = {
+            **node,
+            "like_count": like_counts.get(node["id"], node["like_count"]),
+            "liked_by_user": node["id"] in liked_ids,
+            "replies": []
+        }
+        target.append(copy)
+        stack.extend((reply, copy["replies"]) for reply in reversed(node["replies"]))
+
+    return result
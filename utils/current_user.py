@@ -2,7 +2,8 @@ from services.AuthService import AuthService
 from config.database import get_db
 from models.users import Users
 
-from typing import Annotated
+from dataclasses import dataclass
+from typing import Annotated, Optional
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import HTTPException, status, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -10,28 +11,67 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='auth/login')
+# Для публичных роутов: без заголовка Authorization пользователь анонимный
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl='auth/login', auto_error=False)
 
 
+@dataclass(frozen=True)
+class CurrentPrincipal:
+    """Пользователь из claims access-токена, без обращения к БД"""
+    id: int
+    nickname: Optional[str]
+    email: Optional[str]
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: AsyncSession = Depends(get_db)) -> Users:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+
+async def get_current_principal(token: Annotated[str, Depends(oauth2_scheme)]) -> CurrentPrincipal:
     try:
         token_data = AuthService.decode_jwt_token(token, "access")
         if token_data is None:
-            
-            raise credentials_exception
-        
-        user = await AuthService.get_user_by_id(db, token_data.sub)
-        if user is None:
-            raise credentials_exception
-        return user
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        return CurrentPrincipal(
+            id=int(token_data.sub),
+            nickname=token_data.nickname,
+            email=token_data.email
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Unexpected error: {e}",
             headers={"WWW-Authenticate": "Bearer"}
-        )
\ No newline at end of file
+        )
+
+
+async def get_optional_principal(
+    token: Annotated[Optional[str], Depends(optional_oauth2_scheme)]
+) -> Optional[CurrentPrincipal]:
+    if not token:
+        return None
+    return await get_current_principal(token)
+
+
+async def get_current_user(principal: CurrentPrincipal = Depends(get_current_principal), db: AsyncSession = Depends(get_db)) -> Users:
+    """
+    Строка пользователя из БД - для роутов, которые меняют профиль или читают поля вне claims.
+    Не кэшируется: изменения из других воркеров (ник, аватар, удаление) видны сразу
+    """
+    try:
+        user = await AuthService.get_user_by_id(db, principal.id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Unexpected error: {e}",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
@@ -0,0 +1,70 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from utils.metrics import metrics
+
+
+class ExecutorSaturated(Exception):
+    """Очередь пула заполнена, задача отклонена"""
+
+
+class BoundedExecutor:
+    """Пул потоков для блокирующих вызовов с ограничением параллелизма и метриками очереди"""
+
+    def __init__(self, name: str, max_workers: int, max_queue: Optional[int] = None):
+        """
+        Args:
+            name: Префикс метрик и имен потоков
+            max_workers: Число одновременно выполняемых задач
+            max_queue: Максимум ожидающих задач, сверх него run() бросает ExecutorSaturated (None - без ограничения)
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self._queued = 0
+        self._active = 0
+
+        metrics.register_gauge(f"{name}.queue_depth", lambda: self._queued)
+        metrics.register_gauge(f"{name}.active", lambda: self._active)
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Выполнение func в пуле, не блокируя event loop"""
+        loop = asyncio.get_running_loop()
+        queued_at = time.perf_counter()
+
+        if self.max_queue is not None and self._queued >= self.max_queue and self._semaphore.locked():
+            metrics.inc(f"{self.name}.rejected")
+            raise ExecutorSaturated(f"{self.name}: queue is full ({self._queued})")
+
+        self._queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._queued -= 1
+
+        self._active += 1
+        started_at = time.perf_counter()
+        metrics.observe(f"{self.name}.wait_seconds", started_at - queued_at)
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+            metrics.observe(f"{self.name}.task_seconds", time.perf_counter() - started_at)
+            metrics.inc(f"{self.name}.completed")
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "active": self._active,
+            "queued": self._queued,
+            "max_queue": self.max_queue
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
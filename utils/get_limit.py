@@ -1,27 +1,48 @@
+import time
 from sqlalchemy import func, select
-from services.AuthService import AuthService
+from config.appsettings import Settings
 from config.database import get_db
-from models.users import Users
 from models.guides import Guides
 
-from typing import Annotated
-from fastapi.security import OAuth2PasswordBearer
-from fastapi import HTTPException, status, Depends
+from typing import Optional
+from fastapi import HTTPException, status, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
-async def get_limit(db: AsyncSession = Depends(get_db)) -> int:
-    try:
-        result = await db.execute(select(func.count(Guides.id)))  
-        count = result.scalar()
+class GuideCounter:
+    """Счетчик путеводителей: COUNT только при первом обращении и раз в resync_seconds, дальше инкременты"""
+
+    def __init__(self, resync_seconds: int):
+        self.resync_seconds = resync_seconds
+        self._count: Optional[int] = None
+        self._synced_at = 0.0
+
+    async def get(self, db: AsyncSession) -> int:
+        if self._count is None or time.monotonic() - self._synced_at > self.resync_seconds:
+            result = await db.execute(select(func.count(Guides.id)))
+            self._count = result.scalar()
+            self._synced_at = time.monotonic()
+        return self._count
+
+    def increment(self, delta: int = 1) -> None:
+        if self._count is not None:
+            self._count = max(self._count + delta, 0)
 
-        limit = count // 2
 
-        return limit
+guide_counter = GuideCounter(Settings.GUIDE_COUNT_RESYNC_SECONDS)
+
+
+async def get_limit(
+    limit: Optional[int] = Query(None, ge=1, le=Settings.RECS_MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+) -> int:
+    try:
+        count = await guide_counter.get(db)
+
+        return min(limit or Settings.RECS_PAGE_SIZE, count)
     
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f'Error getting limit: {e}'
         )
-        
\ No newline at end of file
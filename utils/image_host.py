@@ -0,0 +1,8 @@
+from services.ImageHostService import ImageHostService
+from fastapi import Request
+
+# Единственный экземпляр создается в lifespan и хранится в app.state
+
+def get_image_host(request: Request) -> ImageHostService:
+
+    return request.app.state.image_host
@@ -0,0 +1,11 @@
+from typing import Optional
+
+from fastapi import Request
+
+from services.LikeCounterBuffer import LikeCounterBuffer
+
+# Буфер создается в lifespan; в режиме atomic (LIKE_COUNTER_MODE) его нет и счетчики обновляются сразу
+
+def get_like_counter_buffer(request: Request) -> Optional[LikeCounterBuffer]:
+
+    return getattr(request.app.state, "like_counter_buffer", None)
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Union
+
+from config.appsettings import Settings
+from utils.metrics import metrics
+
+
+@dataclass(frozen=True)
+class _Entry:
+    mtime_ns: int
+    size: int
+    text: str
+
+
+class MarkdownCache:
+    """
+    LRU-кэш markdown путеводителей с ограничением по суммарному размеру.
+    Запись действительна, пока у файла не изменились mtime и размер, поэтому
+    правки файла в обход приложения тоже подхватываются
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        metrics.register_gauge("markdown_cache.bytes", lambda: self._bytes)
+        metrics.register_gauge("markdown_cache.entries", lambda: len(self._data))
+        metrics.register_gauge("markdown_cache.hit_rate", self.hit_rate)
+
+    @staticmethod
+    def _read_file(path: str) -> str:
+        with open(path, "rb") as f:
+            return f.read().decode("utf-8")
+
+    async def read(self, path: Union[str, Path]) -> str:
+        path = str(path)
+        stat = os.stat(path)
+
+        with self._lock:
+            entry = self._data.get(path)
+            if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                self._data.move_to_end(path)
+                metrics.inc("markdown_cache.hits")
+                metrics.inc("markdown_cache.bytes_from_cache", entry.size)
+                return entry.text
+
+        text = await asyncio.to_thread(self._read_file, path)
+        metrics.inc("markdown_cache.misses")
+        metrics.inc("markdown_cache.bytes_from_disk", stat.st_size)
+
+        if stat.st_size <= self.max_bytes:
+            self._store(path, _Entry(stat.st_mtime_ns, stat.st_size, text))
+        return text
+
+    def _store(self, path: str, entry: _Entry) -> None:
+        with self._lock:
+            previous = self._data.pop(path, None)
+            if previous is not None:
+                self._bytes -= previous.size
+
+            self._data[path] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes and self._data:
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= evicted.size
+
+    def invalidate(self, path: Union[str, Path]) -> None:
+        with self._lock:
+            entry = self._data.pop(str(path), None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def hit_rate(self) -> Optional[float]:
+        hits = metrics.counter("markdown_cache.hits")
+        total = hits + metrics.counter("markdown_cache.misses")
+        return hits / total if total else None
+
+
+markdown_cache = MarkdownCache(max_bytes=Settings.MARKDOWN_CACHE_MAX_BYTES)
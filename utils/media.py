@@ -0,0 +1,96 @@
+import os
+import re
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from fastapi import Response, status
+from fastapi.responses import FileResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Scope
+
+from config.appsettings import Settings
+
+
+# Имена вида {stem}.{16 hex}.{ext} и ключи хранилища .../{sha256}.{ext}: содержимое по такому имени никогда не меняется
+CONTENT_HASH_RE = re.compile(r"(?:^|[./])([0-9a-f]{16}|[0-9a-f]{64})\.[A-Za-z0-9]+$")
+
+IMMUTABLE_CACHE_CONTROL = f"public, max-age={Settings.MEDIA_IMMUTABLE_MAX_AGE}, immutable"
+
+
+def content_hash(path: Union[str, Path]) -> Optional[str]:
+    match = CONTENT_HASH_RE.search(str(path))
+    return match.group(1) if match else None
+
+
+def cache_control_for(path: Union[str, Path]) -> str:
+    return IMMUTABLE_CACHE_CONTROL if content_hash(path) else Settings.MEDIA_CACHE_CONTROL
+
+
+def file_etag(path: Union[str, Path], stat_result: Optional[os.stat_result] = None) -> str:
+    """Сильный ETag: хэш из имени файла или mtime+размер"""
+    digest = content_hash(path)
+    if digest:
+        return f'"{digest}"'
+    stat_result = stat_result or os.stat(path)
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def is_not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def media_response(
+    path: Union[str, Path],
+    if_none_match: Optional[str] = None,
+    etag: Optional[str] = None,
+    cache_control: Optional[str] = None,
+    media_type: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Отдача файла с ETag, 304 по If-None-Match и Cache-Control.
+    Range/If-Range обрабатывает FileResponse
+    """
+    stat_result = os.stat(path)
+    response_headers = {
+        "ETag": etag or file_etag(path, stat_result),
+        "Cache-Control": cache_control or cache_control_for(path),
+        **(headers or {})
+    }
+
+    if is_not_modified(if_none_match, response_headers["ETag"]):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={k: v for k, v in response_headers.items() if k in ("ETag", "Cache-Control", "Vary")}
+        )
+
+    return FileResponse(path, media_type=media_type, headers=response_headers, stat_result=stat_result)
+
+
+class MediaStaticFiles(StaticFiles):
+    """StaticFiles с настраиваемым Cache-Control и immutable для файлов с хэшем в имени"""
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        response = FileResponse(
+            full_path,
+            status_code=status_code,
+            stat_result=stat_result,
+            headers={
+                "ETag": file_etag(full_path, stat_result),
+                "Cache-Control": cache_control_for(full_path)
+            }
+        )
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+# Бюджет SQL-запросов по шаблону пути роута (проверяется тестами tests/test_query_budgets.py)
+DEFAULT_QUERY_BUDGETS: Dict[str, int] = {
+    "/catalog": 3,
+    "/popular": 3,
+    "/profile": 4,
+    "/recs": 11,
+    "/guide/read_guide/{guide_id}": 6,
+    "/guide/body/{guide_id}": 4,
+    "/guide/overlay/{guide_id}": 2,
+    "/guide/content/{guide_id}": 1,
+    "/guide/like/{guide_id}": 7,
+    "/guide/tags": 1,
+    "/guide/get_guide_logo/{guide_id}": 1,
+    "/comments/add": 5,
+    "/comments/like/{comment_id}": 4,
+    "/comments/{guide_id}": 6,
+    "/comments/replies/{comment_id}": 6,
+    "/user/get_info": 1,
+    "/user/my_avatar": 1,
+    "/user/avatar/{nickname}": 1,
+}
+
+
+class QueryCounter:
+    """Счетчик SQL-запросов в рамках одного HTTP-запроса"""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def add(self, statement: str) -> None:
+        self.count += 1
+        self.statements.append(statement)
+
+
+_current_counter: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+
+def start_counting() -> QueryCounter:
+    """Начать подсчет запросов в текущем контексте (задачи, созданные после, увидят тот же счетчик)"""
+    counter = QueryCounter()
+    _current_counter.set(counter)
+    return counter
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    """Подсчет запросов внутри блока with (для тестов бюджетов)"""
+    counter = QueryCounter()
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    counter = _current_counter.get()
+    if counter is not None:
+        counter.add(statement)
+
+
+def install_query_counter(engine: AsyncEngine) -> None:
+    if event.contains(engine.sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
@@ -1,9 +1,8 @@
 from services.RecommendationService import RecommendationService
-from fastapi import Depends
+from fastapi import Request
 
-# Создаём единственный экземпляр сервиса при старте приложения
-recommendation_service = RecommendationService()
+# Единственный экземпляр сервиса создается в lifespan и хранится в app.state
 
-def get_recommendation_service():
+def get_recommendation_service(request: Request) -> RecommendationService:
 
-    return recommendation_service
\ No newline at end of file
+    return request.app.state.recommendation_service
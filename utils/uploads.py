@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException, UploadFile, status
+
+from config.appsettings import Settings
+from utils.metrics import metrics
+
+
+# Пропускная способность загрузок, МБ/с
+THROUGHPUT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def _open_temp(directory: Path, prefix: str):
+    directory.mkdir(parents=True, exist_ok=True)
+    # Временный файл в той же папке - rename в пределах одной ФС атомарен
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{prefix}.", suffix=".part")
+    # mkstemp создает файл с правами 0600, итоговый файл должен читаться как обычно
+    os.fchmod(fd, 0o644)
+    return fd, tmp_path
+
+
+def _remove(tmp_path: str) -> None:
+    try:
+        os.remove(tmp_path)
+    except FileNotFoundError:
+        pass
+
+
+def _discard(fd: int, tmp_path: str) -> None:
+    os.close(fd)
+    _remove(tmp_path)
+
+
+def _close_synced(fd: int, tmp_path: str) -> None:
+    """fsync и закрытие; при ошибке временный файл удаляется"""
+    try:
+        os.fsync(fd)
+    except BaseException:
+        _discard(fd, tmp_path)
+        raise
+    os.close(fd)
+
+
+def _replace(tmp_path: str, destination: Path) -> None:
+    try:
+        os.replace(tmp_path, destination)
+    except BaseException:
+        _remove(tmp_path)
+        raise
+
+
+def _finalize(fd: int, tmp_path: str, destination: Path) -> None:
+    """fsync и атомарная замена; дескриптор закрывается в любом случае"""
+    _close_synced(fd, tmp_path)
+    _replace(tmp_path, destination)
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def _record(kind: str, size: int, elapsed: float) -> None:
+    metrics.inc(f"uploads.{kind}.count")
+    metrics.inc(f"uploads.{kind}.bytes", size)
+    metrics.observe(f"uploads.{kind}.seconds", elapsed)
+    if elapsed > 0:
+        metrics.observe(f"uploads.{kind}.throughput_mb_s", size / elapsed / (1024 * 1024), THROUGHPUT_BUCKETS)
+
+
+def content_addressed_path(destination: Path, digest: str) -> Path:
+    """{stem}.{16 hex}{suffix} - по такому имени содержимое неизменно (см. utils.media)"""
+    return destination.with_name(f"{destination.stem}.{digest[:16]}{destination.suffix}")
+
+
+@dataclass(frozen=True)
+class StagedFile:
+    """Полностью записанный временный файл, еще не перенесенный на место"""
+    path: Path
+    size: int
+    sha256: str
+
+
+def _too_large(kind: str, max_bytes: int) -> HTTPException:
+    metrics.inc(f"uploads.{kind}.rejected")
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f'File is too large. Maximum size is {max_bytes} bytes'
+    )
+
+
+async def _read_chunks(upload: UploadFile, chunk_size: int) -> AsyncIterator[bytes]:
+    while chunk := await upload.read(chunk_size):
+        yield chunk
+
+
+async def stage_stream(
+    chunks: AsyncIterator[bytes],
+    directory: Path,
+    prefix: str = "upload",
+    max_bytes: Optional[int] = None,
+    kind: str = "file"
+) -> StagedFile:
+    """
+    Запись потока чанков во временный файл в directory вне event loop с подсчетом sha256.
+    Превышение max_bytes прерывает запись сразу. Файл остается временным до commit_staged
+    """
+    start_time = time.perf_counter()
+    fd, tmp_path = await asyncio.to_thread(_open_temp, directory, prefix)
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            digest.update(chunk)
+            if max_bytes is not None and size > max_bytes:
+                raise _too_large(kind, max_bytes)
+            await asyncio.to_thread(_write_all, fd, chunk)
+    except BaseException:
+        await asyncio.to_thread(_discard, fd, tmp_path)
+        raise
+    await asyncio.to_thread(_close_synced, fd, tmp_path)
+
+    _record(kind, size, time.perf_counter() - start_time)
+    return StagedFile(path=Path(tmp_path), size=size, sha256=digest.hexdigest())
+
+
+async def stage_upload(
+    upload: UploadFile,
+    directory: Path,
+    max_bytes: int,
+    kind: str = "file",
+    chunk_size: int = Settings.UPLOAD_CHUNK_SIZE,
+    prefix: str = "upload"
+) -> StagedFile:
+    # Размер известен заранее, если multipart-парсер уже посчитал его
+    if upload.size is not None and upload.size > max_bytes:
+        raise _too_large(kind, max_bytes)
+    return await stage_stream(_read_chunks(upload, chunk_size), directory, prefix, max_bytes, kind)
+
+
+async def commit_staged(staged: StagedFile, destination: Path) -> None:
+    """Атомарный перенос временного файла на место (в пределах одной ФС)"""
+    await asyncio.to_thread(destination.parent.mkdir, parents=True, exist_ok=True)
+    await asyncio.to_thread(_replace, str(staged.path), destination)
+
+
+async def discard_staged(staged: StagedFile) -> None:
+    await asyncio.to_thread(_remove, str(staged.path))
+
+
+async def save_upload(
+    upload: UploadFile,
+    destination: Path,
+    max_bytes: int,
+    kind: str = "file",
+    chunk_size: int = Settings.UPLOAD_CHUNK_SIZE,
+    content_addressed: bool = False
+) -> Path:
+    """
+    Потоковое сохранение UploadFile: чанки пишутся во временный файл вне event loop,
+    превышение max_bytes прерывает загрузку сразу, затем fsync и атомарный rename.
+    content_addressed=True добавляет к имени хэш содержимого. Возвращает итоговый путь
+    """
+    staged = await stage_upload(upload, destination.parent, max_bytes, kind, chunk_size, prefix=destination.name)
+
+    if content_addressed:
+        destination = content_addressed_path(destination, staged.sha256)
+    await commit_staged(staged, destination)
+    return destination
+
+
+def _write_bytes_atomic(destination: Path, data: bytes) -> None:
+    fd, tmp_path = _open_temp(destination.parent, destination.name)
+    try:
+        _write_all(fd, data)
+    except BaseException:
+        _discard(fd, tmp_path)
+        raise
+    _finalize(fd, tmp_path, destination)
+
+
+async def write_bytes_atomic(destination: Path, data: bytes, kind: str = "file") -> None:
+    """Запись файла целиком вне event loop: временный файл, fsync и атомарный rename"""
+    start_time = time.perf_counter()
+    await asyncio.to_thread(_write_bytes_atomic, destination, data)
+    _record(kind, len(data), time.perf_counter() - start_time)